@@ -5,7 +5,8 @@ import json
 sys.path.insert(0, '/Users/lubinquan/Desktop/study/Xfetch/twscrape')
 
 from twscrape import API, AccountsPool
-from twscrape.db import execute
+
+from get_list_tweets import open_db
 
 DB_PATH = "/Users/lubinquan/Desktop/study/Xfetch/accounts.db"
 
@@ -43,7 +44,12 @@ async def setup():
         SET cookies = ?, headers = ?, active = 1, error_msg = NULL
         WHERE username = ?
     """
-    await execute(DB_PATH, sql, [cookies_json, headers_json, "roger2862541"])
+    db = await open_db(DB_PATH)
+    try:
+        await db.execute(sql, [cookies_json, headers_json, "roger2862541"])
+        await db.commit()
+    finally:
+        await db.close()
 
 
 async def debug_raw():
@@ -3,43 +3,87 @@ import asyncio
 import sys
 sys.path.insert(0, '/Users/lubinquan/Desktop/study/Xfetch/twscrape')
 
+import aiosqlite
 from twscrape import API
-from twscrape.db import execute
 
 DB_PATH = "/Users/lubinquan/Desktop/study/Xfetch/accounts.db"
 LIST_ID = 2010759492212760999  # MY AI LIST
 
 
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+async def open_db(db_path: str) -> aiosqlite.Connection:
+    """打开数据库并设置 WAL 等 PRAGMA，避免与正在运行的抓取进程争锁"""
+    db = await aiosqlite.connect(db_path)
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+
 async def reset_locks():
-    await execute(DB_PATH, 'UPDATE accounts SET locks = "{}"')
+    db = await open_db(DB_PATH)
+    try:
+        await db.execute("UPDATE accounts SET locks = '{}'")
+        await db.commit()
+    finally:
+        await db.close()
+
+
+def format_tweet(index, tweet):
+    lines = [
+        f"\n{'─'*70}",
+        f"📝 推文 #{index}",
+        f"{'─'*70}",
+        f"  作者: @{tweet.user.username} ({tweet.user.displayname})",
+        f"  时间: {tweet.date.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"  链接: {tweet.url}",
+        f"\n  内容:",
+    ]
+    # 格式化内容，每行最多 60 字符
+    content = tweet.rawContent
+    lines.extend(f"    {content[i:i+60]}" for i in range(0, len(content), 60))
+    lines.append(f"\n  💬 回复: {tweet.replyCount}  🔄 转发: {tweet.retweetCount}  ❤️ 点赞: {tweet.likeCount}")
+
+    if tweet.media and (tweet.media.photos or tweet.media.videos):
+        media_count = len(tweet.media.photos) + len(tweet.media.videos)
+        lines.append(f"  📷 媒体: {media_count} 个")
+
+    return "\n".join(lines)
 
 
 async def get_list_timeline():
     api = API(DB_PATH, debug=False)
+    # 生产者拉取分页，消费者格式化推文，网络请求与格式化互相重叠
+    queue = asyncio.Queue(maxsize=32)
 
     print(f"\n{'='*70}")
     print(f"获取 MY AI LIST (ID: {LIST_ID}) 的最新 10 条推文")
     print('='*70)
 
-    count = 0
-    async for tweet in api.list_timeline(LIST_ID, limit=10):
-        count += 1
-        print(f"\n{'─'*70}")
-        print(f"📝 推文 #{count}")
-        print(f"{'─'*70}")
-        print(f"  作者: @{tweet.user.username} ({tweet.user.displayname})")
-        print(f"  时间: {tweet.date.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  链接: {tweet.url}")
-        print(f"\n  内容:")
-        # 格式化内容，每行最多 60 字符
-        content = tweet.rawContent
-        for i in range(0, len(content), 60):
-            print(f"    {content[i:i+60]}")
-        print(f"\n  💬 回复: {tweet.replyCount}  🔄 转发: {tweet.retweetCount}  ❤️ 点赞: {tweet.likeCount}")
-
-        if tweet.media and (tweet.media.photos or tweet.media.videos):
-            media_count = len(tweet.media.photos) + len(tweet.media.videos)
-            print(f"  📷 媒体: {media_count} 个")
+    async def produce():
+        try:
+            async for tweet in api.list_timeline(LIST_ID, limit=10):
+                await queue.put(tweet)
+        finally:
+            await queue.put(None)
+
+    # 格式化结果先缓存，抓取结束后一次性写出，避免在事件循环中逐行阻塞输出
+    output = []
+
+    async def consume():
+        while (tweet := await queue.get()) is not None:
+            output.append(format_tweet(len(output) + 1, tweet))
+
+    await asyncio.gather(produce(), consume())
+    count = len(output)
+    if output:
+        sys.stdout.write("\n".join(output) + "\n")
 
     print(f"\n{'='*70}")
     print(f"共获取 {count} 条推文")
@@ -0,0 +1,152 @@
+"""博主统计存储 - SQLite 按行更新，替代整文件重写的 JSON"""
+
+import json
+import sqlite3
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterator, Mapping, Optional
+
+from .base import json_dumps, json_loads
+
+# 每个博主保留的最近评分条数
+RECENT_SCORES_WINDOW = 20
+
+AUTHOR_COLUMNS = (
+    'displayname',
+    'followers',
+    'total_tweets',
+    'passed_tweets',
+    'rejected_tweets',
+    'total_score',
+    'recent_sum',
+    'recent_count',
+    'scores',
+    'first_seen',
+    'last_seen',
+)
+
+
+class AuthorStore:
+    """
+    基于 SQLite 的博主统计
+
+    - 每个博主一行，scores（最近评分）以 JSON 存储，读出后为定长 deque
+    - 只写回本次运行中变化的博主，单个事务批量 UPSERT
+    - 首次启动时自动迁移旧版 author_stats.json
+    """
+
+    def __init__(self, db_path: str, legacy_json: Optional[str] = None) -> None:
+        path = Path(db_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 允许在线程池中写回（同一时刻只有一个线程使用该连接）
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS authors (
+                username TEXT PRIMARY KEY,
+                displayname TEXT,
+                followers INTEGER,
+                total_tweets INTEGER,
+                passed_tweets INTEGER,
+                rejected_tweets INTEGER,
+                total_score INTEGER,
+                recent_sum INTEGER,
+                recent_count INTEGER,
+                scores TEXT,
+                first_seen TEXT,
+                last_seen TEXT
+            )
+        """)
+
+        if legacy_json:
+            self._migrate(Path(legacy_json))
+
+    def _migrate(self, legacy_path: Path) -> None:
+        """导入旧版 author_stats.json，导入后重命名避免重复迁移"""
+        if not legacy_path.exists():
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                authors = json.load(f).get('authors', {})
+        except (json.JSONDecodeError, IOError):
+            return
+        for stats in authors.values():
+            stats['recent_sum'] = sum(stats['scores'])
+            stats['recent_count'] = len(stats['scores'])
+        self.upsert_many(authors)
+        legacy_path.rename(legacy_path.with_suffix('.json.migrated'))
+
+    @staticmethod
+    def _to_stats(row: sqlite3.Row) -> dict[str, Any]:
+        stats = {column: row[column] for column in AUTHOR_COLUMNS}
+        stats['scores'] = deque(
+            json_loads(stats['scores']) if stats['scores'] else (), maxlen=RECENT_SCORES_WINDOW
+        )
+        return stats
+
+    def get(self, username: str) -> Optional[dict[str, Any]]:
+        """查询单个博主，不存在返回 None"""
+        row = self.conn.execute(
+            "SELECT * FROM authors WHERE username = ?", (username,)
+        ).fetchone()
+        return self._to_stats(row) if row else None
+
+    def iter_all(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """遍历全部博主 (username, stats)"""
+        for row in self.conn.execute("SELECT * FROM authors"):
+            yield row['username'], self._to_stats(row)
+
+    def iter_ranked(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """按通过率降序遍历全部博主，pass_rate / avg_score / recent_avg 由 SQLite 计算"""
+        rows = self.conn.execute("""
+            SELECT *,
+                   CAST(passed_tweets AS REAL) / total_tweets AS pass_rate,
+                   CAST(total_score AS REAL) / total_tweets AS avg_score,
+                   COALESCE(CAST(recent_sum AS REAL) / NULLIF(recent_count, 0), 0) AS recent_avg
+            FROM authors
+            WHERE total_tweets > 0
+            ORDER BY pass_rate DESC
+        """)
+        for row in rows:
+            stats = self._to_stats(row)
+            stats['pass_rate'] = row['pass_rate']
+            stats['avg_score'] = row['avg_score']
+            stats['recent_avg'] = row['recent_avg']
+            yield row['username'], stats
+
+    def low_quality_usernames(self, min_tweets: int, max_pass_rate: float) -> set[str]:
+        """样本足够且通过率不高于阈值的博主"""
+        rows = self.conn.execute(
+            "SELECT username FROM authors "
+            "WHERE total_tweets >= ? AND passed_tweets <= total_tweets * ?",
+            (min_tweets, max_pass_rate)
+        )
+        return {row[0] for row in rows}
+
+    def upsert_many(self, authors: Mapping[str, dict[str, Any]]) -> None:
+        """批量写入博主统计"""
+        rows = [
+            (username, *(
+                json_dumps(list(stats[column]), indent=False).decode('utf-8')
+                if column == 'scores' else stats[column]
+                for column in AUTHOR_COLUMNS
+            ))
+            for username, stats in authors.items()
+        ]
+        if not rows:
+            return
+        updates = ', '.join(f"{column} = excluded.{column}" for column in AUTHOR_COLUMNS)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO authors (username, {', '.join(AUTHOR_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(AUTHOR_COLUMNS) + 1))}) "
+                f"ON CONFLICT(username) DO UPDATE SET {updates}",
+                rows
+            )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,35 +1,110 @@
 """基础模块类 - 所有模块的抽象基类"""
 
+import atexit
+import copy
 import json
 import logging
+import os
+import queue
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Any, Optional
 
 import yaml
 
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时退回标准库
+    orjson = None
+
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 已解析的配置缓存: (绝对路径, mtime, 文件大小) -> 配置字典
+_CONFIG_CACHE: dict[tuple[str, float, int], dict[str, Any]] = {}
+_CONFIG_LOCK = threading.Lock()
+
+# 本进程内已确认存在的输出目录，避免重复 mkdir 系统调用
+_MKDIR_CACHE: set[str] = set()
+
+# 后台写日志文件的监听器，进程退出时统一刷新
+_LOG_LISTENERS: list[QueueListener] = []
+
+
+@atexit.register
+def _stop_log_listeners() -> None:
+    for listener in _LOG_LISTENERS:
+        listener.stop()
+
+
+def ensure_parent_dir(path: Path) -> None:
+    """确保文件所在目录存在（每个目录在进程内只创建一次）"""
+    parent = str(path.parent)
+    if parent not in _MKDIR_CACHE:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _MKDIR_CACHE.add(parent)
+
+
+def json_loads(data: str | bytes) -> Any:
+    """解析 JSON（优先使用 orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_default(obj: Any) -> Any:
+    """标准库 json 的兜底序列化：datetime 输出与 orjson 一致的 ISO 8601 字符串"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"无法序列化 {type(obj).__name__} 类型")
+
+
+def json_dumps(data: Any, indent: bool = True) -> bytes:
+    """序列化为 UTF-8 JSON（优先使用 orjson），indent=False 时输出紧凑格式；datetime 输出 ISO 8601"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
 
 class BaseModule(ABC):
     """所有模块的基类"""
 
+    # 输出文件默认紧凑格式（体积小、写入快）；需要人工查看或 diff 时用 --pretty 打开缩进
+    pretty_json: bool = False
+
     def __init__(self, config_path: str) -> None:
         self.config_path = Path(config_path)
         self.config = self._load_config()
         self.logger = self._setup_logger()
 
     def _load_config(self) -> dict[str, Any]:
-        """加载配置文件"""
+        """加载配置文件（按路径、修改时间和大小缓存解析结果）"""
         if not self.config_path.exists():
             raise FileNotFoundError(f"配置文件不存在: {self.config_path}")
 
-        with open(self.config_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        stat = self.config_path.stat()
+        key = (str(self.config_path.resolve()), stat.st_mtime, stat.st_size)
+        with _CONFIG_LOCK:
+            if key not in _CONFIG_CACHE:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    _CONFIG_CACHE[key] = yaml.load(f, Loader=_YAML_LOADER)
+            config = _CONFIG_CACHE[key]
+
+        return copy.deepcopy(config)
 
     def _setup_logger(self) -> logging.Logger:
-        """设置日志（控制台 + 文件）"""
+        """设置日志（控制台 + 文件，文件由后台线程写入）"""
         logger = logging.getLogger(self.__class__.__name__)
+        if logger.handlers:
+            return logger
+
         logger.setLevel(logging.INFO)
+        logger.propagate = False
 
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -42,13 +117,20 @@ class BaseModule(ABC):
 
         log_dir = Path("logs")
         log_dir.mkdir(exist_ok=True)
-        file_handler = logging.FileHandler(
+        file_handler = RotatingFileHandler(
             log_dir / f"{self.__class__.__name__.lower()}.log",
+            maxBytes=10 * 1024 * 1024,
+            backupCount=3,
             encoding='utf-8'
         )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        _LOG_LISTENERS.append(listener)
+        logger.addHandler(QueueHandler(log_queue))
 
         return logger
 
@@ -59,16 +141,27 @@ class BaseModule(ABC):
             self.logger.warning(f"文件不存在: {file_path}")
             return None
 
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(path, 'rb') as f:
+            return json_loads(f.read())
 
     def save_json(self, data: Any, file_path: str) -> None:
         """保存 JSON 文件"""
         path = Path(file_path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        ensure_parent_dir(path)
+
+        # 先写临时文件再原子替换，下游阶段不会读到写了一半的文件
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        if orjson is not None:
+            # orjson 在一次 C 调用中直接生成 UTF-8 字节，没有中间 str
+            tmp_path.write_bytes(json_dumps(data, indent=self.pretty_json))
+        else:
+            # 标准库 json.dump 逐块 iterencode 写入文件，峰值内存不随数据量翻倍
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                if self.pretty_json:
+                    json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
+                else:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        os.replace(tmp_path, path)
 
         self.logger.info(f"保存文件: {file_path}")
 
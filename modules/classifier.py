@@ -1,13 +1,21 @@
 """分类模块 - 对内容进行分类"""
 
-import json
-from typing import Any, Optional
-
-from google import genai
-from google.genai import types
-from openai import OpenAI
+import asyncio
+import copy
+import re
+from collections import Counter, defaultdict
+from typing import Any, Iterator, Optional
 
 from .base import BaseModule
+from .llm_client import (
+    call_with_retry,
+    estimate_tokens,
+    get_client,
+    pack_batches,
+    parse_llm_json,
+    run_async,
+)
+from .result_cache import ResultCache
 
 DEFAULT_CLASSIFICATION = {
     'category': '其他',
@@ -16,6 +24,35 @@ DEFAULT_CLASSIFICATION = {
     'key_points': []
 }
 
+# LLM 把结果数组包在对象里时常用的键
+RESULT_WRAPPER_KEYS = ('results', 'data', 'items', 'classifications')
+
+# 每条推文在提示词中的固定开销 + 输出摘要/要点的预估 token 数
+TWEET_TOKEN_OVERHEAD = 200
+
+# LLM 返回的分类名中可能夹带的空白、markdown 加粗和 emoji
+_CATEGORY_NOISE = re.compile(r'[\s*\uFE0F\u2600-\u27BF\U0001F300-\U0001FAFF]+')
+
+# 提示词固定部分放在最前面，同一分类体系下各批次共享相同前缀，可命中服务商的前缀缓存
+BATCH_PROMPT_PREFIX = """对一批AI推文进行批量分类和摘要。
+
+{category_info}
+
+任务：
+1. 为每条推文选择最合适的**主分类**和**子分类**
+2. 生成简洁的**摘要**（50-100字）
+3. 提取**2-4个关键要点**
+
+请返回JSON数组，每条对应一个结果：
+[
+  {{"id": 1, "category": "分类名称", "sub_category": "子分类", "summary": "摘要", "key_points": ["要点1", "要点2"]}},
+  ...
+]
+
+注意：category只填写名称，不要包含emoji（如：时闻、深度解析、技术技巧等）
+
+"""
+
 
 class Classifier(BaseModule):
     """内容分类模块 - 支持批量处理"""
@@ -25,12 +62,27 @@ class Classifier(BaseModule):
         self.categories = self.config['categories']
         self.provider = self.config.get('llm_provider', 'openai')
         self.model = self.config['llm_model']
-        self.batch_size = self.config.get('batch_size', 5)
+        self.batch_size = self.config.get('batch_size', 20)
+        self.max_batch_tokens = self.config.get('max_batch_tokens', 6000)
+        self.max_concurrency = self.config.get('max_concurrency', 8)
+        self.max_retries = self.config.get('max_retries', 4)
+        self._prompt_prefix = BATCH_PROMPT_PREFIX.format(category_info=self._build_category_prompt())
+
+        # 分类结果缓存：模型或分类体系变化时命名空间随之变化，旧结果自然失效
+        self.cache = None
+        if self.config.get('use_cache', True):
+            self.cache = ResultCache(
+                self.config.get('cache_file', 'data/classify_cache.db'),
+                namespace=f"{self.provider}:{self.model}\n{self._prompt_prefix}",
+                ttl_days=self.config.get('cache_ttl_days', 30)
+            )
 
         if self.provider == 'gemini':
-            self.client = genai.Client(api_key=self.config['gemini_api_key'])
-        else:
-            self.client = OpenAI(api_key=self.config['openai_api_key'])
+            from google.genai import types
+            self._types = types
+
+        api_key_field = 'gemini_api_key' if self.provider == 'gemini' else 'openai_api_key'
+        self.client = get_client(self.provider, self.config[api_key_field])
 
     def _build_category_prompt(self) -> str:
         """构建分类体系描述"""
@@ -40,20 +92,26 @@ class Classifier(BaseModule):
             lines.append(f"  子分类: {', '.join(cat['sub_categories'])}\n")
         return "\n".join(lines)
 
-    def _call_llm(self, prompt: str, system_prompt: str = "你是一个专业的AI内容分类专家。") -> str:
-        """调用LLM获取JSON响应"""
+    async def _call_llm(self, prompt: str, system_prompt: str = "你是一个专业的AI内容分类专家。") -> str:
+        """调用LLM获取JSON响应，遇到限流/服务端错误时指数退避重试"""
+        return await call_with_retry(
+            lambda: self._request_llm(prompt, system_prompt), self.max_retries, self.logger
+        )
+
+    async def _request_llm(self, prompt: str, system_prompt: str) -> str:
+        """发送单次LLM请求"""
         if self.provider == 'gemini':
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config=types.GenerateContentConfig(
+                config=self._types.GenerateContentConfig(
                     temperature=0.3,
                     response_mime_type='application/json'
                 )
             )
             return response.text.strip()
         else:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -64,41 +122,20 @@ class Classifier(BaseModule):
             )
             return response.choices[0].message.content
 
-    def _classify_batch(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        """批量分类多条推文"""
+    async def _classify_batch(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """批量分类多条推文，返回结构异常时二分重试，仍失败的推文使用默认分类"""
         if not tweets:
             return []
 
-        category_info = self._build_category_prompt()
-
-        tweets_text = []
+        parts = [self._prompt_prefix, f"以下是需要分类的{len(tweets)}条推文：\n\n"]
+        append = parts.append
         for i, tweet in enumerate(tweets, 1):
-            user = tweet['user']
-            tweets_text.append(
-                f"【推文{i}】\n作者: @{user['username']}\n内容: {tweet['content'][:500]}"
-            )
-
-        prompt = f"""对以下{len(tweets)}条AI推文进行批量分类和摘要。
-
-{category_info}
-
-{chr(10).join(tweets_text)}
-
-任务：
-1. 为每条推文选择最合适的**主分类**和**子分类**
-2. 生成简洁的**摘要**（50-100字）
-3. 提取**2-4个关键要点**
-
-请返回JSON数组，每条对应一个结果：
-[
-  {{"id": 1, "category": "分类名称", "sub_category": "子分类", "summary": "摘要", "key_points": ["要点1", "要点2"]}},
-  ...
-]
-
-注意：category只填写名称，不要包含emoji（如：时闻、深度解析、技术技巧等）"""
+            append(f"【推文{i}】\n作者: @{tweet['user']['username']}\n内容: {tweet['content'][:500]}\n\n")
+        prompt = ''.join(parts)
 
         try:
-            results = json.loads(self._call_llm(prompt))
+            results = self._unwrap_results(parse_llm_json(await self._call_llm(prompt), self.logger))
+            returned = len(results)
 
             while len(results) < len(tweets):
                 self.logger.warning(
@@ -109,14 +146,106 @@ class Classifier(BaseModule):
                     'summary': tweets[len(results)]['content'][:100]
                 })
 
+            results = [self._to_classification(result) for result in results[:len(tweets)]]
+
+            if self.cache:
+                self.cache.put_many(
+                    (tweet['content'], result) for tweet, result in zip(tweets, results[:returned])
+                )
+
             return results
 
+        except ValueError as e:
+            # 返回内容无法解析时对半拆分重试，避免一条异常推文拖垮整批
+            if len(tweets) > 1:
+                mid = len(tweets) // 2
+                self.logger.warning(f"批量结果解析失败({len(tweets)}条)，拆分为 {mid}+{len(tweets) - mid} 条重试: {e}")
+                return await self._classify_batch(tweets[:mid]) + await self._classify_batch(tweets[mid:])
+            self.logger.error(f"分类结果解析失败: {e}")
+
         except Exception as e:
             self.logger.error(f"批量分类失败: {e}")
-            return [
-                {**DEFAULT_CLASSIFICATION, 'summary': tweet['content'][:100]}
-                for tweet in tweets
-            ]
+
+        return [
+            {**DEFAULT_CLASSIFICATION, 'summary': tweet['content'][:100]}
+            for tweet in tweets
+        ]
+
+    @staticmethod
+    def _to_classification(result: dict[str, Any]) -> dict[str, Any]:
+        """把LLM返回的对象整理为固定字段的分类记录，丢弃多余字段，缺失字段取默认值"""
+        category = _CATEGORY_NOISE.sub('', str(result.get('category') or ''))
+        key_points = result.get('key_points')
+        return {
+            'category': category or DEFAULT_CLASSIFICATION['category'],
+            'sub_category': str(result.get('sub_category') or DEFAULT_CLASSIFICATION['sub_category']),
+            'summary': str(result.get('summary') or ''),
+            'key_points': [str(p) for p in key_points] if isinstance(key_points, list) else [],
+        }
+
+    @staticmethod
+    def _is_result_list(value: Any) -> bool:
+        """结果必须是由对象组成的数组"""
+        return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+
+    @classmethod
+    def _unwrap_results(cls, parsed: Any) -> list[dict[str, Any]]:
+        """
+        校验LLM返回的结构，兼容被对象包裹的数组
+
+        OpenAI 的 json_object 模式只能返回对象，模型常返回 {"results": [...]} 一类结构，
+        这里先尝试常见的包裹键，再尝试唯一的数组字段，都不符合时抛出 ValueError。
+        """
+        if cls._is_result_list(parsed):
+            return parsed
+
+        if isinstance(parsed, dict):
+            for key in RESULT_WRAPPER_KEYS:
+                if cls._is_result_list(parsed.get(key)):
+                    return parsed[key]
+
+            lists = [v for v in parsed.values() if cls._is_result_list(v)]
+            if len(lists) == 1:
+                return lists[0]
+
+        raise ValueError(f"无法识别的返回结构: {type(parsed).__name__}")
+
+    @staticmethod
+    def _group_duplicates(tweets: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+        """按归一化内容（小写、合并空白）分组，内容完全相同的推文只需分类一次"""
+        groups = defaultdict(list)
+        for tweet in tweets:
+            groups[' '.join(tweet['content'].lower().split())].append(tweet)
+        return groups
+
+    @staticmethod
+    def _estimate_tokens(tweet: dict[str, Any]) -> int:
+        """粗略估算单条推文占用的 token 数（内容 + 提示词格式与输出的固定开销）"""
+        return estimate_tokens(tweet['content'][:500]) + TWEET_TOKEN_OVERHEAD
+
+    def _pack_batches(self, tweets: list[dict[str, Any]]) -> Iterator[list[dict[str, Any]]]:
+        """按 token 预算贪心打包批次，每批不超过 max_batch_tokens 且不超过 batch_size 条"""
+        return pack_batches(tweets, self._estimate_tokens, self.max_batch_tokens, self.batch_size)
+
+    async def _classify_all(self, tweets: list[dict[str, Any]]) -> None:
+        """并发分类所有批次，结果按原顺序写回推文"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = list(self._pack_batches(tweets))
+
+        async def classify(start: int, batch: list[dict[str, Any]]) -> list[dict[str, Any]]:
+            async with semaphore:
+                self.logger.info(f"处理批次: {start + 1}-{start + len(batch)}/{len(tweets)}")
+                return await self._classify_batch(batch)
+
+        starts = [0]
+        for batch in batches[:-1]:
+            starts.append(starts[-1] + len(batch))
+
+        results = await asyncio.gather(*(classify(i, b) for i, b in zip(starts, batches)))
+
+        for batch, batch_results in zip(batches, results):
+            for tweet, classification in zip(batch, batch_results):
+                tweet['classification'] = classification
 
     def run(self, input_file: str) -> Optional[str]:
         """运行分类（批量处理）"""
@@ -126,24 +255,41 @@ class Classifier(BaseModule):
             return None
 
         tweets = data['tweets']
-        self.logger.info(f"开始分类 {len(tweets)} 条推文 (批量大小: {self.batch_size})")
-
-        for batch_start in range(0, len(tweets), self.batch_size):
-            batch_end = min(batch_start + self.batch_size, len(tweets))
-            batch = tweets[batch_start:batch_end]
-
-            self.logger.info(f"处理批次: {batch_start + 1}-{batch_end}/{len(tweets)}")
-            results = self._classify_batch(batch)
-
-            for tweet, classification in zip(batch, results):
-                tweet['classification'] = classification
+        self.logger.info(
+            f"开始分类 {len(tweets)} 条推文 "
+            f"(每批最多 {self.batch_size} 条 / {self.max_batch_tokens} tokens, "
+            f"并发数: {self.max_concurrency})"
+        )
+
+        groups = self._group_duplicates(tweets)
+        representatives = [members[0] for members in groups.values()]
+        if len(representatives) < len(tweets):
+            self.logger.info(f"内容去重: {len(tweets)} -> {len(representatives)} 条需要调用LLM")
+
+        misses = representatives
+        if self.cache:
+            hits = self.cache.get_many(tweet['content'] for tweet in representatives)
+            misses = []
+            for tweet in representatives:
+                cached = hits.get(tweet['content'])
+                if cached is None:
+                    misses.append(tweet)
+                else:
+                    tweet['classification'] = cached
+            if len(misses) < len(representatives):
+                self.logger.info(f"缓存命中 {len(representatives) - len(misses)} 条")
+
+        if misses:
+            run_async(self._classify_all(misses))
+
+        for members in groups.values():
+            classification = members[0]['classification']
+            for tweet in members[1:]:
+                tweet['classification'] = copy.deepcopy(classification)
 
         self.logger.info("分类完成")
 
-        category_counts = {}
-        for tweet in tweets:
-            cat = tweet['classification']['category']
-            category_counts[cat] = category_counts.get(cat, 0) + 1
+        category_counts = dict(Counter(t['classification']['category'] for t in tweets))
 
         self.logger.info(f"分类统计: {category_counts}")
 
@@ -1,16 +1,80 @@
 """内容分析模块 - 批量判断AI相关性和内容价值，追踪博主质量评分"""
 
-import json
+import asyncio
+import heapq
 import re
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
 from typing import Any, Optional
 
-from google import genai
 from google.genai import types
+from pydantic import BaseModel
 
-from .base import BaseModule
+from .author_store import RECENT_SCORES_WINDOW, AuthorStore
+from .base import BaseModule, ensure_parent_dir, json_dumps, json_loads
 from .kol_agent import KOLAgent
+from .llm_client import (
+    RateLimiter,
+    call_with_retry,
+    estimate_tokens,
+    get_client,
+    pack_batches,
+    parse_llm_json,
+    run_async,
+)
+from .result_cache import RT_PREFIX, ResultCache, normalize_content
+from .seen_store import SeenStore
+
+# 分析提示词版本，修改提示词或评分标准时递增，使旧缓存失效
+ANALYSIS_PROMPT_VERSION = 3
+
+_RT_RE = re.compile(r'^RT @(\w+):\s*(.+)$', re.DOTALL)
+_URL_RE = re.compile(r'https?://\S+')
+
+# 规则预筛：出现任一AI关键词的推文一律交给LLM判断
+_AI_KEYWORD_RE = re.compile(
+    r'\b(ai|agi|ml|llms?|gpt\w*|claude|gemini|llama|openai|anthropic|deepmind|mistral|'
+    r'transformers?|diffusion|neural|machine learning|deep learning|prompt|agents?|rag|'
+    r'fine-?tun\w*|inference|benchmark|model|chatbot|copilot|nvidia|gpu)\b'
+    r'|人工智能|大模型|模型|智能体|机器学习|深度学习|神经网络|算法|算力|推理|训练|微调|提示词',
+    re.IGNORECASE
+)
+# 去掉链接、@提及、emoji、标点和空白后剩下的才算实质文字
+_NON_TEXT_RE = re.compile(
+    r'https?://\S+|@\w+|[\s\W_\uFE0F\u2600-\u27BF\U0001F000-\U0001FAFF]+'
+)
+
+# 评估标准放在系统指令中，每个批次的提示词只包含推文列表
+SYSTEM_PROMPT = """批量评估推文的AI相关性和内容价值，每条推文返回一个结果。
+1. AI相关性 relevance_score(0-100): 必须明确讨论AI/ML/大模型技术，仅有#AI标签无实质内容<50
+2. 内容价值 value_score(1-10): 8-10原创深度/重要发布 | 5-7中等 | 1-4低价值
+3. 虚假信息 is_fake_news: 提到不存在的AI模型(如GPT-5/Claude-4)时为true并说明 fake_reason
+转发(RT)按原内容评估，不因转发降分；高粉丝作者可能更权威。
+返回JSON数组: [{"id": 推文序号, "is_ai_related", "relevance_score", "value_score", "reason": "简短理由", "is_fake_news", "fake_reason"}]"""
+
+# 并发分析时输出进度日志的间隔（秒）
+PROGRESS_LOG_INTERVAL = 5
+
+# 提示词中单条推文内容的最大字符数（链接替换为占位符后再截断）
+MAX_PROMPT_CONTENT_CHARS = 300
+
+# 批量大小自动校准时依次尝试的大小
+CALIBRATION_SIZES = (5, 10, 20, 40)
+
+# 每条推文在内容之外的 token 开销（作者/互动行 + 输出结果）
+TWEET_TOKEN_OVERHEAD = 100
+
+BATCH_JOB_DONE_STATES = {
+    'JOB_STATE_SUCCEEDED',
+    'JOB_STATE_FAILED',
+    'JOB_STATE_CANCELLED',
+    'JOB_STATE_EXPIRED',
+}
 
 DEFAULT_ANALYSIS_RESULT = {
     'is_ai_related': False,
@@ -22,6 +86,17 @@ DEFAULT_ANALYSIS_RESULT = {
 }
 
 
+class AnalysisResult(BaseModel):
+    """单条推文分析结果的结构化输出 schema"""
+    id: int
+    is_ai_related: bool
+    relevance_score: int
+    value_score: int
+    reason: str
+    is_fake_news: bool
+    fake_reason: str
+
+
 class ContentAnalyzer(BaseModule):
     """
     内容分析模块 - 批量判断AI相关性和内容价值
@@ -39,170 +114,427 @@ class ContentAnalyzer(BaseModule):
         self.value_threshold = self.config.get('value_threshold', 5)
         self.provider = self.config.get('llm_provider', 'gemini')
         self.model = self.config.get('llm_model', 'gemini-2.0-flash-lite')
-        self.batch_size = self.config.get('batch_size', 5)
+        self.batch_size = self.config.get('batch_size', 20)
+        self.max_batch_tokens = self.config.get('max_batch_tokens', 4000)
+        self.max_concurrency = self.config.get('max_concurrency', 8)
+        self.use_batch_api = self.config.get('use_batch_api', False)
+        self.max_retries = self.config.get('max_retries', 4)
+        self.skip_authors_config = self.config.get('skip_low_quality_authors', {})
+        self.rule_filter_config = self.config.get('rule_prefilter', {})
+        qpm = self.config.get('qpm')
+        self.rate_limiter = RateLimiter(qpm) if qpm else None
+        if qpm:
+            # 并发数超过每秒配额没有意义，只会让请求在限速器前排队
+            self.max_concurrency = max(1, min(self.max_concurrency, qpm // 60))
+
+        # 批量大小自动校准：用第一次运行的真实批次测量吞吐，结果保存后复用
+        self.calibrate_batch_size = self.config.get('calibrate_batch_size', False)
+        self.calibration_file = self.config.get('calibration_file', 'data/batch_calibration.json')
+        if self.calibrate_batch_size and Path(self.calibration_file).exists():
+            calibration = self.load_json(self.calibration_file)
+            # 换模型或调整 token 预算后，之前选出的批量大小不再适用
+            if (calibration.get('model') == self.model
+                    and calibration.get('max_batch_tokens', self.max_batch_tokens) == self.max_batch_tokens):
+                self.batch_size = calibration['batch_size']
+                self.calibrate_batch_size = False
+
+        # 按推文内容缓存分析结果，重复内容（转发风暴、模板公告）不再调用LLM
+        self.cache = None
+        if self.config.get('use_cache', True):
+            self.cache = ResultCache(
+                self.config.get('cache_file', 'data/llm_cache.sqlite'),
+                namespace=f"{self.provider}:{self.model}:analysis-v{ANALYSIS_PROMPT_VERSION}",
+                max_entries=self.config.get('cache_max_entries', 50000),
+                ttl_days=self.config.get('cache_ttl_days', 30)
+            )
 
         if self.provider == 'gemini':
-            self.client = genai.Client(api_key=self.config['gemini_api_key'])
-
-        self.author_stats_file = Path("data/author_stats.json")
-        self.author_stats = self._load_author_stats()
-
-        self.processed_ids_file = Path("data/processed_ids.json")
-        self.processed_ids = self._load_processed_ids()
+            self.client = get_client('gemini', self.config['gemini_api_key'])
+
+        # 可选的本地向量预筛：与AI种子语料相似度过低的推文直接判为无关，不调用LLM
+        prefilter_config = self.config.get('prefilter', {})
+        self.prefilter_threshold = prefilter_config.get('threshold', 0.3)
+        self._embedder = None
+        self._ai_centroid = None
+        if prefilter_config.get('enabled', False):
+            self._init_prefilter(prefilter_config)
+
+        # 博主统计按行存储；本次运行中变化的博主先留在内存，run 结束时一次写回
+        self.authors = AuthorStore(
+            "data/author_stats.sqlite",
+            legacy_json="data/author_stats.json"
+        )
+        self._dirty_authors: dict[str, dict[str, Any]] = {}
+        # 本次运行的时间戳，run 开始时设置一次，所有博主共用
+        self._now_iso = datetime.now().isoformat()
+        # 本次运行中已解析的RT信息 (tweet id -> _extract_rt_content 结果)，构建提示词时复用
+        self._rt_info: dict[str, tuple[bool, str, str]] = {}
+
+        self.processed_ids = SeenStore(
+            "data/processed_ids.sqlite",
+            max_entries=10000,
+            legacy_json="data/processed_ids.json"
+        )
 
         self.kol_agent = KOLAgent()
 
-    def _load_author_stats(self) -> dict[str, Any]:
-        """加载博主统计数据"""
-        if self.author_stats_file.exists():
-            try:
-                with open(self.author_stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
-                pass
-        return {'authors': {}, 'last_updated': None}
-
-    def _load_processed_ids(self) -> set:
-        """加载已处理的推文ID集合"""
-        if self.processed_ids_file.exists():
-            try:
-                with open(self.processed_ids_file, 'r', encoding='utf-8') as f:
-                    return set(json.load(f).get('ids', []))
-            except (json.JSONDecodeError, IOError):
-                pass
-        return set()
-
-    def _save_processed_ids(self) -> None:
-        """保存已处理的推文ID（保留最近10000个）"""
-        ids_list = list(self.processed_ids)
-        if len(ids_list) > 10000:
-            ids_list = ids_list[-10000:]
-            self.processed_ids = set(ids_list)
-
-        self.processed_ids_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.processed_ids_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'ids': ids_list,
-                'count': len(ids_list),
-                'last_updated': datetime.now().isoformat()
-            }, f, ensure_ascii=False, indent=2)
+    def _init_prefilter(self, prefilter_config: dict[str, Any]) -> None:
+        """加载本地嵌入模型并计算AI种子语料的中心向量"""
+        from sentence_transformers import SentenceTransformer
+
+        seed_file = Path(prefilter_config.get('seed_file', 'config/ai_seed_corpus.txt'))
+        seeds = [
+            line.strip() for line in seed_file.read_text(encoding='utf-8').splitlines()
+            if line.strip() and not line.startswith('#')
+        ]
+        self._embedder = SentenceTransformer(prefilter_config.get('model', 'all-MiniLM-L6-v2'))
+        centroid = self._embedder.encode(seeds, normalize_embeddings=True).mean(axis=0)
+        self._ai_centroid = centroid / ((centroid ** 2).sum() ** 0.5)
+        self.logger.info(f"本地预筛已启用 (种子语料 {len(seeds)} 条, 阈值 {self.prefilter_threshold})")
+
+    def _is_obviously_off_topic(self, tweet: dict[str, Any]) -> bool:
+        """规则预筛：没有任何AI关键词且几乎没有实质文字（纯链接/emoji/@）的推文"""
+        content = tweet['content']
+        if _AI_KEYWORD_RE.search(content):
+            return False
+        if self.rule_filter_config.get('require_keyword', False):
+            return True
+        return len(_NON_TEXT_RE.sub('', content)) < self.rule_filter_config.get('min_text_chars', 10)
+
+    def _prefilter(self, tweets: list[dict[str, Any]]) -> set[int]:
+        """返回明显与AI无关的推文下标（一次批量编码全部推文）"""
+        if self._embedder is None or not tweets:
+            return set()
+        embeddings = self._embedder.encode(
+            [tweet['content'] for tweet in tweets], normalize_embeddings=True
+        )
+        scores = embeddings @ self._ai_centroid
+        return {i for i, score in enumerate(scores) if score < self.prefilter_threshold}
 
     def _save_author_stats(self) -> None:
-        """保存博主统计数据"""
-        self.author_stats['last_updated'] = datetime.now().isoformat()
-        self.author_stats_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.author_stats_file, 'w', encoding='utf-8') as f:
-            json.dump(self.author_stats, f, ensure_ascii=False, indent=2)
-
-    def _update_author_stats(
-        self,
-        username: str,
-        displayname: str,
-        followers: int,
-        passed: bool,
-        score: int
-    ) -> None:
-        """更新博主统计数据"""
-        authors = self.author_stats['authors']
-        now = datetime.now().isoformat()
-
-        if username not in authors:
-            authors[username] = {
-                'displayname': displayname,
-                'followers': followers,
-                'total_tweets': 0,
-                'passed_tweets': 0,
-                'rejected_tweets': 0,
-                'total_score': 0,
-                'scores': [],
-                'first_seen': now,
-                'last_seen': None
-            }
-
-        author = authors[username]
-        author['total_tweets'] += 1
-        author['last_seen'] = now
-        author['displayname'] = displayname
-        author['followers'] = followers
-        author['total_score'] += score
-
-        if passed:
-            author['passed_tweets'] += 1
-        else:
-            author['rejected_tweets'] += 1
-
-        author['scores'].append(score)
-        if len(author['scores']) > 20:
-            author['scores'] = author['scores'][-20:]
+        """写回本次运行中变化的博主统计"""
+        self.authors.upsert_many(self._dirty_authors)
+        self._dirty_authors.clear()
+
+    def _apply_author_deltas(self, deltas: dict[str, dict[str, Any]]) -> None:
+        """
+        把本次运行按博主汇总的增量一次性合并进博主统计
+
+        deltas: username -> {'displayname', 'followers', 'passed': 通过数, 'scores': 本次评分列表}
+        """
+        now = self._now_iso
+        for username, delta in deltas.items():
+            author = self._dirty_authors.get(username) or self.authors.get(username)
+            if author is None:
+                author = {
+                    'displayname': delta['displayname'],
+                    'followers': delta['followers'],
+                    'total_tweets': 0,
+                    'passed_tweets': 0,
+                    'rejected_tweets': 0,
+                    'total_score': 0,
+                    'recent_sum': 0,
+                    'recent_count': 0,
+                    'scores': deque(maxlen=RECENT_SCORES_WINDOW),
+                    'first_seen': now,
+                    'last_seen': None
+                }
+            self._dirty_authors[username] = author
+
+            new_scores = delta['scores']
+            author['total_tweets'] += len(new_scores)
+            author['passed_tweets'] += delta['passed']
+            author['rejected_tweets'] += len(new_scores) - delta['passed']
+            author['total_score'] += sum(new_scores)
+            author['last_seen'] = now
+            author['displayname'] = delta['displayname']
+            author['followers'] = delta['followers']
+
+            # 最近评分为定长 deque，满时 append 自动挤出最旧的一条；和与条数随窗口增量维护
+            scores = author['scores']
+            for score in new_scores:
+                if len(scores) == scores.maxlen:
+                    author['recent_sum'] -= scores[0]
+                scores.append(score)
+                author['recent_sum'] += score
+            author['recent_count'] = len(scores)
 
     def _extract_rt_content(self, content: str) -> tuple[bool, str, str]:
         """提取RT转发的原始内容，返回 (is_rt, original_author, original_content)"""
-        rt_match = re.match(r'^RT @(\w+):\s*(.+)$', content, re.DOTALL)
+        if not content.startswith(RT_PREFIX):
+            return False, '', content
+        rt_match = _RT_RE.match(content)
         if rt_match:
             return True, rt_match.group(1), rt_match.group(2)
         return False, '', content
 
-    def _analyze_batch(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        """批量分析多条推文"""
-        if not tweets:
-            return []
-
-        tweets_text = []
-        for i, tweet in enumerate(tweets, 1):
-            user = tweet['user']
-            is_rt, rt_author, _ = self._extract_rt_content(tweet['content'])
-            rt_note = f" [转发自@{rt_author}]" if is_rt else ""
-
-            tweets_text.append(
-                f"【推文{i}】{rt_note}\n"
-                f"作者: @{user['username']} ({user['displayname']}) | 粉丝: {user['followers']}\n"
-                f"互动: 回复{tweet['replyCount']} 转发{tweet['retweetCount']} 点赞{tweet['likeCount']}\n"
-                f"内容: {tweet['content'][:500]}"
-            )
+    @staticmethod
+    def _shrink(content: str) -> str:
+        """压缩推文内容：链接替换为 [url]（t.co 短链对判断无用却占 token），再截断"""
+        return _URL_RE.sub('[url]', content)[:MAX_PROMPT_CONTENT_CHARS]
 
-        prompt = f"""请批量分析以下{len(tweets)}条推文的AI相关性和内容价值。
+    def _format_tweet(self, index: int, tweet: dict[str, Any]) -> str:
+        """格式化提示词中的单条推文"""
+        user = tweet['user']
+        rt_info = self._rt_info.get(tweet['id']) or self._extract_rt_content(tweet['content'])
+        is_rt, rt_author, _ = rt_info
+        rt_note = f" [转发自@{rt_author}]" if is_rt else ""
+        # 过长的显示名多为 emoji/口号堆砌，对判断无帮助，只保留用户名
+        displayname = f" ({user['displayname']})" if len(user['displayname']) < 30 else ""
 
-{chr(10).join(tweets_text)}
+        return (
+            f"【推文{index}】{rt_note}\n"
+            f"作者: @{user['username']}{displayname} | 粉丝: {user['followers']}\n"
+            f"互动: 回复{tweet['replyCount']} 转发{tweet['retweetCount']} 点赞{tweet['likeCount']}\n"
+            f"内容: {self._shrink(tweet['content'])}"
+        )
 
-评估标准：
-1. AI相关性(0-100): 必须明确讨论AI/ML/大模型技术。仅有#AI标签无实质内容<50分
-2. 内容价值(1-10): 8-10高价值(原创深度/重要发布) | 5-7中等 | 1-4低价值
-3. 虚假信息: 检查是否提到不存在的AI模型(如GPT-5/Claude-4等)
+    def _build_batch_prompt(self, tweets: list[dict[str, Any]]) -> str:
+        """构建批量分析提示词"""
+        return f"分析以下{len(tweets)}条推文：\n\n" + "\n".join(
+            self._format_tweet(i, tweet) for i, tweet in enumerate(tweets, 1)
+        )
 
-重要：转发(RT)内容应评估原内容价值，不因转发降分。高粉丝作者的内容可能更权威。
+    async def _analyze_batch(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """批量分析多条推文（一次调用，结果按 id 对齐），解析失败时二分重试"""
+        if not tweets:
+            return []
 
-请返回JSON数组，每条对应一个结果：
-[
-  {{"id": 1, "is_ai_related": true/false, "relevance_score": 0-100, "value_score": 1-10, "reason": "简短理由", "is_fake_news": false, "fake_reason": ""}},
-  ...
-]"""
+        prompt = self._build_batch_prompt(tweets)
 
         try:
-            response = self.client.models.generate_content(
+            response = await self._generate(prompt)
+            # 结构化输出由 SDK 直接解析；解析失败时 parsed 为 None，退回原文走对齐/二分逻辑
+            if response.parsed is not None:
+                parsed = [result.model_dump() for result in response.parsed]
+            else:
+                parsed = parse_llm_json(response.text, self.logger)
+            return self._align_results(parsed, len(tweets))
+
+        except ValueError as e:
+            # 返回内容无法解析时对半拆分重试，而不是整批按默认结果拒绝
+            if len(tweets) > 1:
+                mid = len(tweets) // 2
+                self.logger.warning(f"批量结果解析失败({len(tweets)}条)，拆分为 {mid}+{len(tweets) - mid} 条重试: {e}")
+                return await self._analyze_batch(tweets[:mid]) + await self._analyze_batch(tweets[mid:])
+            self.logger.error(f"分析结果解析失败: {e}")
+            return [self._error_result(f'Error: {e}')]
+
+        except Exception as e:
+            # 重试耗尽仍失败：不记为已处理，下次运行重新分析
+            self.logger.error(f"批量分析失败: {e}")
+            return [self._error_result(f'Error: {e}', retryable=True) for _ in tweets]
+
+    async def _generate(self, prompt: str) -> Any:
+        """发送分析请求（经过限速器，可重试错误自动退避重试）"""
+        return await call_with_retry(
+            lambda: self.client.aio.models.generate_content(
                 model=self.model,
                 contents=prompt,
                 config=types.GenerateContentConfig(
+                    system_instruction=SYSTEM_PROMPT,
                     temperature=0.2,
-                    response_mime_type='application/json'
+                    response_mime_type='application/json',
+                    response_schema=list[AnalysisResult]
                 )
-            )
-            results = json.loads(response.text.strip())
+            ),
+            self.max_retries,
+            self.logger,
+            self.rate_limiter
+        )
 
-            while len(results) < len(tweets):
-                self.logger.warning(
-                    f"批量结果数量不匹配: 期望{len(tweets)}, 得到{len(results)}"
-                )
-                results.append({**DEFAULT_ANALYSIS_RESULT, 'reason': '分析结果缺失'})
+    @staticmethod
+    def _error_result(reason: str, retryable: bool = False) -> dict[str, Any]:
+        """
+        分析失败时的默认结果，带 error 标记（不写入缓存）
+
+        retryable 表示失败与内容无关（网络/限流/服务端），这类推文留待下次运行
+        """
+        result = {**DEFAULT_ANALYSIS_RESULT, 'reason': reason, 'error': True}
+        if retryable:
+            result['retryable'] = True
+        return result
+
+    def _align_results(self, parsed: Any, count: int) -> list[dict[str, Any]]:
+        """
+        按结果中的 id（从1开始）对齐到输入顺序，id 缺失或重复时按位置对齐
+
+        缺失的条目用默认结果补齐；虚假信息的价值分封顶为2
+        """
+        if isinstance(parsed, dict):
+            parsed = parsed.get('results')
+        if not isinstance(parsed, list) or not all(isinstance(r, dict) for r in parsed):
+            raise ValueError("返回结果不是对象数组")
+
+        aligned: list[Optional[dict[str, Any]]] = [None] * count
+        for position, result in enumerate(parsed[:count]):
+            index = result.get('id')
+            if not isinstance(index, int) or not 1 <= index <= count or aligned[index - 1] is not None:
+                index = position + 1
+            if aligned[index - 1] is None:
+                aligned[index - 1] = result
+
+        missing = aligned.count(None)
+        if missing:
+            self.logger.warning(f"批量结果数量不匹配: 期望{count}, 缺失{missing}")
+
+        for result in aligned:
+            if result is not None and result.get('is_fake_news', False):
+                result['value_score'] = min(result['value_score'], 2)
+
+        return [
+            result if result is not None else self._error_result('分析结果缺失')
+            for result in aligned
+        ]
+
+    @staticmethod
+    def _prompt_tokens(content: str) -> int:
+        """单条推文在提示词中的预估 token 数，打包和校准共用"""
+        return estimate_tokens(content[:MAX_PROMPT_CONTENT_CHARS]) + TWEET_TOKEN_OVERHEAD
+
+    def _calibration_sizes(self, misses: list[str]) -> tuple[int, ...]:
+        """
+        按本次推文的平均长度，筛出 max_batch_tokens 装得下的候选批量大小
+
+        装不下的大小在正式运行时会被 pack_batches 拆小，测出来的吞吐没有意义。
+        """
+        per_tweet = sum(map(self._prompt_tokens, misses)) / len(misses)
+        fit = int(self.max_batch_tokens // per_tweet)
+        return tuple(size for size in CALIBRATION_SIZES if size <= fit) or CALIBRATION_SIZES[:1]
+
+    def _calibrate(
+        self,
+        misses: list[str],
+        representatives: dict[str, int],
+        tweets: list[dict[str, Any]],
+        sizes: tuple[int, ...]
+    ) -> tuple[list[list[str]], list[list[dict[str, Any]]]]:
+        """
+        依次用 sizes 中的批量大小分析本次运行的前几批推文，测量每秒完成的推文数
+
+        每个大小同时发出相同数量的批次（不超过 max_concurrency），与正式运行的并发方式一致，
+        这样测到的是并发下的实际吞吐，而不是单次调用的延迟。
+        批量继续增大但吞吐提升不足10%时停止，选出的批量大小写入 calibration_file。
+        探测用的都是真实待分析推文，结果照常使用，不产生额外调用。
+        """
+        # 各大小使用相同的并发批次数，保证吞吐可比
+        parallel = max(1, min(self.max_concurrency, len(misses) // sum(sizes)))
+        probe_batches = []
+        probe_results = []
+        best_size, best_throughput = self.batch_size, 0.0
+        start = 0
+        for size in sizes:
+            batches = [misses[start + i * size:start + (i + 1) * size] for i in range(parallel)]
+            start += size * parallel
+            started = time.monotonic()
+            results = run_async(self._analyze_all(
+                [[tweets[representatives[key]] for key in batch] for batch in batches]
+            ))
+            throughput = size * parallel / (time.monotonic() - started)
+            probe_batches += batches
+            probe_results += results
+            self.logger.info(f"批量校准: {size}条/批 x {parallel}并发 -> {throughput:.2f}条/秒")
+
+            if any(result.get('error') for batch_results in results for result in batch_results):
+                break
+            if best_throughput and throughput < best_throughput * 1.1:
+                break
+            best_size, best_throughput = size, throughput
+
+        self.batch_size = best_size
+        self.calibrate_batch_size = False
+        self.save_json({
+            'model': self.model,
+            'max_batch_tokens': self.max_batch_tokens,
+            'batch_size': best_size,
+            'throughput': round(best_throughput, 2),
+            'calibrated_at': self._now_iso
+        }, self.calibration_file)
+        self.logger.info(f"批量大小校准完成: {best_size}")
+        return probe_batches, probe_results
+
+    async def _analyze_all(self, batches: list[list[dict[str, Any]]]) -> list[list[dict[str, Any]]]:
+        """并发分析所有批次（信号量限制并发数），结果顺序与批次一致"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        total = sum(len(batch) for batch in batches)
+        done = 0
+
+        async def analyze(batch: list[dict[str, Any]]) -> list[dict[str, Any]]:
+            nonlocal done
+            async with semaphore:
+                results = await self._analyze_batch(batch)
+            done += len(batch)
+            return results
 
-            for result in results:
-                if result.get('is_fake_news', False):
-                    result['value_score'] = min(result['value_score'], 2)
+        async def report_progress() -> None:
+            # 各协程只累加计数，由这里定期汇总输出一条进度日志
+            while True:
+                await asyncio.sleep(PROGRESS_LOG_INTERVAL)
+                self.logger.info(f"分析进度: {done}/{total}")
 
-            return results
+        reporter = asyncio.create_task(report_progress())
+        try:
+            return await asyncio.gather(*(analyze(batch) for batch in batches))
+        finally:
+            reporter.cancel()
+
+    def _analyze_via_batch_api(self, batches: list[list[dict[str, Any]]]) -> list[list[dict[str, Any]]]:
+        """
+        通过 Gemini Batch API 离线分析所有批次（价格为实时调用的50%，不受每分钟限额约束）
+
+        每个批次一行 JSONL 请求，提交后轮询直到任务结束，再按 key 取回结果。
+        适合对时效不敏感的定时任务，通常在数分钟到数小时内完成。
+        """
+        with tempfile.NamedTemporaryFile('wb', suffix='.jsonl', delete=False) as f:
+            for i, batch in enumerate(batches):
+                f.write(json_dumps({
+                    'key': f'batch-{i}',
+                    'request': {
+                        'contents': [{'role': 'user', 'parts': [{'text': self._build_batch_prompt(batch)}]}],
+                        'system_instruction': {'parts': [{'text': SYSTEM_PROMPT}]},
+                        'generation_config': {'temperature': 0.2, 'response_mime_type': 'application/json'}
+                    }
+                }, indent=False) + b'\n')
+            requests_file = f.name
+
+        uploaded = self.client.files.upload(
+            file=requests_file,
+            config=types.UploadFileConfig(display_name=Path(requests_file).name, mime_type='jsonl')
+        )
+        Path(requests_file).unlink(missing_ok=True)
+
+        job = self.client.batches.create(model=self.model, src=uploaded.name)
+        self.logger.info(f"已提交 Batch API 任务: {job.name} ({len(batches)} 个批次)")
+
+        delay = 30
+        while job.state.name not in BATCH_JOB_DONE_STATES:
+            time.sleep(delay)
+            delay = min(delay * 1.5, 300)
+            job = self.client.batches.get(name=job.name)
+            self.logger.info(f"Batch API 任务状态: {job.state.name}")
+
+        responses = {}
+        if job.state.name == 'JOB_STATE_SUCCEEDED':
+            content = self.client.files.download(file=job.dest.file_name)
+            for line in content.splitlines():
+                if line.strip():
+                    item = json_loads(line)
+                    responses[item.get('key')] = item.get('response')
+        else:
+            self.logger.error(f"Batch API 任务失败: {job.state.name}")
+        job_failed = job.state.name != 'JOB_STATE_SUCCEEDED'
 
-        except Exception as e:
-            self.logger.error(f"批量分析失败: {e}")
-            return [{**DEFAULT_ANALYSIS_RESULT, 'reason': f'Error: {e}'} for _ in tweets]
+        batch_results = []
+        for i, batch in enumerate(batches):
+            try:
+                text = responses[f'batch-{i}']['candidates'][0]['content']['parts'][0]['text']
+                results = self._align_results(parse_llm_json(text, self.logger), len(batch))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                self.logger.error(f"Batch API 结果缺失或无法解析 (批次{i + 1}): {e}")
+                results = [self._error_result(f'Error: {e}', retryable=job_failed) for _ in batch]
+            batch_results.append(results)
+
+        return batch_results
 
     def _is_tweet_passed(self, analysis: dict[str, Any]) -> bool:
         """判断推文是否通过筛选"""
@@ -212,6 +544,33 @@ class ContentAnalyzer(BaseModule):
             analysis['value_score'] >= self.value_threshold
         )
 
+    def _append_rejections(
+        self,
+        rejected: list[tuple[dict[str, Any], dict[str, Any]]],
+        rejected_file: str
+    ) -> None:
+        """
+        把被拒绝推文的判定记录追加到按天的 JSONL 文件
+
+        只记录 id、作者和评分理由，不重复写出整条推文；原文仍可从 data/raw 中查到
+        """
+        lines = [
+            json_dumps({
+                'id': tweet['id'],
+                'username': tweet['user']['username'],
+                'relevance_score': analysis['relevance_score'],
+                'value_score': analysis['value_score'],
+                'is_fake_news': analysis.get('is_fake_news', False),
+                'reason': analysis['reason'],
+                'stage': 'content_analyzer'
+            }, indent=False)
+            for tweet, analysis in rejected
+        ]
+        path = Path(rejected_file)
+        ensure_parent_dir(path)
+        with open(path, 'ab') as f:
+            f.write(b'\n'.join(lines) + b'\n')
+
     def _enrich_tweet_with_analysis(
         self,
         tweet: dict[str, Any],
@@ -239,9 +598,10 @@ class ContentAnalyzer(BaseModule):
     def get_author_report(
         self,
         min_tweets: int = 5,
-        enable_kol_check: bool = True
+        enable_kol_check: bool = True,
+        top_n: Optional[int] = None
     ) -> dict[str, Any]:
-        """生成博主质量报告"""
+        """生成博主质量报告，top_n 限制各列表返回的条数（统计摘要仍按全部博主计算）"""
         report = {
             'generated_at': datetime.now().isoformat(),
             'summary': {},
@@ -255,11 +615,12 @@ class ContentAnalyzer(BaseModule):
         authors_data = []
         suspicious_authors = []
 
-        for username, stats in self.author_stats['authors'].items():
+        # 已按通过率降序，高质量/全部列表无需再排序
+        for username, stats in self.authors.iter_ranked():
             followers = stats['followers']
             total_tweets = stats['total_tweets']
             passed_tweets = stats['passed_tweets']
-            pass_rate = passed_tweets / total_tweets if total_tweets > 0 else 0
+            pass_rate = stats['pass_rate']
 
             if enable_kol_check and self.kol_agent.should_check(stats):
                 suspicious_authors.append({
@@ -275,11 +636,8 @@ class ContentAnalyzer(BaseModule):
             if total_tweets < required_tweets:
                 continue
 
-            avg_score = stats['total_score'] / total_tweets
-            recent_avg = (
-                sum(stats['scores']) / len(stats['scores'])
-                if stats['scores'] else 0
-            )
+            avg_score = stats['avg_score']
+            recent_avg = stats['recent_avg']
 
             author_info = {
                 'username': username,
@@ -309,6 +667,7 @@ class ContentAnalyzer(BaseModule):
             self.logger.info(f"检测到 {len(suspicious_authors)} 个可疑博主，启动KOL识别...")
             kol_results = self.kol_agent.batch_identify(suspicious_authors)
 
+            keep_usernames = set()
             for username, result in kol_results.items():
                 report['identified_kols'].append({
                     'username': username,
@@ -320,15 +679,15 @@ class ContentAnalyzer(BaseModule):
                 })
 
                 if result.get('is_important_kol') or result.get('recommendation') == 'keep':
-                    report['recommend_remove'] = [
-                        a for a in report['recommend_remove']
-                        if a['username'] != username
-                    ]
-
-        report['high_quality_authors'].sort(key=lambda x: x['pass_rate'], reverse=True)
-        report['low_quality_authors'].sort(key=lambda x: x['pass_rate'])
-        report['recommend_remove'].sort(key=lambda x: x['recent_avg_score'])
-        authors_data.sort(key=lambda x: x['pass_rate'], reverse=True)
+                    keep_usernames.add(username)
+
+            if keep_usernames:
+                report['recommend_remove'] = [
+                    a for a in report['recommend_remove']
+                    if a['username'] not in keep_usernames
+                ]
+
+        report['low_quality_authors'].reverse()
         report['all_authors'] = authors_data
 
         report['summary'] = {
@@ -339,17 +698,30 @@ class ContentAnalyzer(BaseModule):
             'identified_kols_count': len(report['identified_kols'])
         }
 
+        if top_n is None:
+            report['recommend_remove'].sort(key=itemgetter('recent_avg_score'))
+        else:
+            # 其余列表已按通过率有序，直接截断；recommend_remove 只取评分最低的 top_n 个
+            report['recommend_remove'] = heapq.nsmallest(
+                top_n, report['recommend_remove'], key=itemgetter('recent_avg_score')
+            )
+            for key in ('high_quality_authors', 'low_quality_authors', 'all_authors'):
+                report[key] = report[key][:top_n]
+
         return report
 
     def run(self, input_file: str) -> Optional[str]:
         """运行内容分析"""
+        self._now_iso = datetime.now().isoformat()
+        self._rt_info = {}
         data = self.load_json(input_file)
         if not data or 'tweets' not in data:
             self.logger.error("无效的输入文件")
             return None
 
         all_tweets = data['tweets']
-        tweets = [t for t in all_tweets if t['id'] not in self.processed_ids]
+        seen_ids = self.processed_ids.seen_among([t['id'] for t in all_tweets])
+        tweets = [t for t in all_tweets if t['id'] not in seen_ids]
         skipped_count = len(all_tweets) - len(tweets)
 
         if skipped_count > 0:
@@ -359,70 +731,188 @@ class ContentAnalyzer(BaseModule):
             self.logger.info("所有推文都已处理过，无新内容")
             return None
 
-        self.logger.info(f"开始分析 {len(tweets)} 条新推文 (批量大小: {self.batch_size})")
+        self.logger.info(
+            f"开始分析 {len(tweets)} 条新推文 "
+            f"(每批最多: {self.batch_size}条/{self.max_batch_tokens} tokens, 并发数: {self.max_concurrency})"
+        )
 
         passed_tweets = []
         rejected_tweets = []
 
-        for batch_start in range(0, len(tweets), self.batch_size):
-            batch_end = min(batch_start + self.batch_size, len(tweets))
-            batch = tweets[batch_start:batch_end]
-
-            self.logger.info(f"处理批次: {batch_start + 1}-{batch_end}/{len(tweets)}")
-            results = self._analyze_batch(batch)
-
-            for tweet, analysis in zip(batch, results):
-                user = tweet['user']
-                passed = self._is_tweet_passed(analysis)
-
-                self._update_author_stats(
-                    user['username'],
-                    user['displayname'],
-                    user['followers'],
-                    passed=passed,
-                    score=analysis['value_score']
-                )
-
-                if passed:
-                    passed_tweets.append(self._enrich_tweet_with_analysis(tweet, analysis))
-                else:
-                    rejected_tweets.append(tweet)
+        analyses: list[Optional[dict[str, Any]]] = [None] * len(tweets)
 
-        for tweet in tweets:
-            self.processed_ids.add(tweet['id'])
-        self._save_processed_ids()
-        self._save_author_stats()
+        # 已确认的低质量博主直接拒绝，不调用LLM；高互动的推文仍然分析，给博主翻身的机会
+        if self.skip_authors_config.get('enabled', True):
+            blocked_authors = self.authors.low_quality_usernames(
+                self.skip_authors_config.get('min_tweets', 5),
+                self.skip_authors_config.get('max_pass_rate', 0.15)
+            )
+            min_likes = self.skip_authors_config.get('min_likes_override', 50)
+            blocked_count = 0
+            for i, tweet in enumerate(tweets):
+                if tweet['user']['username'] in blocked_authors and tweet['likeCount'] < min_likes:
+                    analyses[i] = {**DEFAULT_ANALYSIS_RESULT, 'reason': '低质量博主: 跳过分析', 'skipped': True}
+                    blocked_count += 1
+            if blocked_count:
+                self.logger.info(f"跳过低质量博主推文 {blocked_count} 条")
+
+        if self.rule_filter_config.get('enabled', True):
+            rule_rejected = 0
+            for i, tweet in enumerate(tweets):
+                if analyses[i] is None and self._is_obviously_off_topic(tweet):
+                    analyses[i] = {**DEFAULT_ANALYSIS_RESULT, 'reason': '规则预筛: 无实质AI内容'}
+                    rule_rejected += 1
+            if rule_rejected:
+                self.logger.info(f"规则预筛排除 {rule_rejected} 条推文")
+
+        pending = [i for i, analysis in enumerate(analyses) if analysis is None]
+        off_topic = self._prefilter([tweets[i] for i in pending])
+        for j in off_topic:
+            analyses[pending[j]] = {**DEFAULT_ANALYSIS_RESULT, 'reason': '本地预筛: 与AI无关'}
+        if off_topic:
+            self.logger.info(f"本地预筛排除 {len(off_topic)} 条无关推文")
+
+        # 同一原文（原推及其RT转发，忽略链接和空白差异）只分析一次，结果广播给组内每条推文
+        groups: dict[str, list[int]] = {}
+        for i, tweet in enumerate(tweets):
+            if analyses[i] is not None:
+                continue
+            rt_info = self._rt_info[tweet['id']] = self._extract_rt_content(tweet['content'])
+            groups.setdefault(normalize_content(rt_info[2]), []).append(i)
+
+        hits = self.cache.get_many(groups) if self.cache else {}
+        misses = []
+        for actual_content, members in groups.items():
+            cached = hits.get(actual_content)
+            if cached is None:
+                misses.append(actual_content)
+            else:
+                for i in members:
+                    analyses[i] = cached
+        duplicate_count = len(pending) - len(off_topic) - len(groups)
+        if duplicate_count:
+            self.logger.info(f"合并重复内容 {duplicate_count} 条")
+        if len(misses) < len(groups):
+            self.logger.info(f"缓存命中 {len(groups) - len(misses)} 条")
+
+        # 每组优先用原推作为代表，保留原作者和互动数据
+        representatives = {
+            actual_content: next(
+                (i for i in groups[actual_content] if not tweets[i]['content'].startswith(RT_PREFIX)),
+                groups[actual_content][0]
+            )
+            for actual_content in misses
+        }
+        batches: list[list[str]] = []
+        batch_results: list[list[dict[str, Any]]] = []
+        sizes = self._calibration_sizes(misses) if self.calibrate_batch_size and misses else ()
+        if sizes and not self.use_batch_api and len(misses) >= sum(sizes):
+            probe_batches, probe_results = self._calibrate(misses, representatives, tweets, sizes)
+            batches += probe_batches
+            batch_results += probe_results
+            # 校准可能提前停止，只跳过实际探测过的条目
+            misses = misses[sum(map(len, probe_batches)):]
+
+        # 按 token 预算打包：短推文一批多装几条，减少调用次数
+        packed = list(pack_batches(
+            misses,
+            self._prompt_tokens,
+            self.max_batch_tokens,
+            self.batch_size
+        ))
+        tweet_batches = [[tweets[representatives[key]] for key in batch] for batch in packed]
+        batches += packed
+        if packed and self.use_batch_api:
+            batch_results += self._analyze_via_batch_api(tweet_batches)
+        elif packed:
+            batch_results += run_async(self._analyze_all(tweet_batches))
+
+        new_results = []
+        for batch, results in zip(batches, batch_results):
+            for actual_content, analysis in zip(batch, results):
+                for i in groups[actual_content]:
+                    analyses[i] = analysis
+                if not analysis.get('error'):
+                    new_results.append((actual_content, analysis))
+        if self.cache:
+            self.cache.put_many(new_results)
+
+        # 兜底：任何未得到结果的推文都按请求失败处理，下次运行重试
+        unresolved = [i for i, analysis in enumerate(analyses) if analysis is None]
+        if unresolved:
+            self.logger.error(f"{len(unresolved)} 条推文没有分析结果，推迟到下次运行")
+            for i in unresolved:
+                analyses[i] = self._error_result('分析结果缺失', retryable=True)
+
+        deferred_ids = set()
+        # 博主统计先按博主汇总本次增量，循环结束后一次合并
+        author_deltas: dict[str, dict[str, Any]] = {}
+        passed_score_sum = 0
+        for tweet, analysis in zip(tweets, analyses):
+            if analysis.get('retryable'):
+                deferred_ids.add(tweet['id'])
+                continue
+            if analysis.get('skipped'):
+                # 未经分析的推文不计入博主统计，否则被跳过的博主通过率只会越来越低、永远无法翻身
+                rejected_tweets.append((tweet, analysis))
+                continue
+            user = tweet['user']
+            passed = self._is_tweet_passed(analysis)
+
+            delta = author_deltas.get(user['username'])
+            if delta is None:
+                delta = author_deltas[user['username']] = {'passed': 0, 'scores': []}
+            delta['displayname'] = user['displayname']
+            delta['followers'] = user['followers']
+            delta['passed'] += passed
+            delta['scores'].append(analysis['value_score'])
+
+            if passed:
+                passed_tweets.append(self._enrich_tweet_with_analysis(tweet, analysis))
+                passed_score_sum += analysis['value_score']
+            else:
+                rejected_tweets.append((tweet, analysis))
+
+        self._apply_author_deltas(author_deltas)
+
+        analyzed_count = len(tweets) - len(deferred_ids)
+        self.logger.info(f"分析完成: {len(passed_tweets)}/{analyzed_count} 条推文通过")
+        if deferred_ids:
+            self.logger.warning(f"{len(deferred_ids)} 条推文因请求失败未完成分析，下次运行重试")
+
+        rejected_file = f"data/rejected/analyzer_{self._now_iso[:10]}.jsonl"
+        output_file = input_file.replace('/raw/', '/evaluated/')
 
-        self.logger.info(f"分析完成: {len(passed_tweets)}/{len(tweets)} 条推文通过")
+        # 去重记录、博主统计和两个输出文件互不依赖，放到线程池并行写入
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            writes = [
+                pool.submit(self.processed_ids.add_many, [
+                    tweet['id'] for tweet in tweets if tweet['id'] not in deferred_ids
+                ]),
+                pool.submit(self._save_author_stats),
+            ]
+            if rejected_tweets:
+                writes.append(pool.submit(self._append_rejections, rejected_tweets, rejected_file))
+            if passed_tweets:
+                writes.append(pool.submit(self.save_json, {
+                    **data,
+                    'tweets': passed_tweets,
+                    'analysis_stats': {
+                        'total': analyzed_count,
+                        'passed': len(passed_tweets),
+                        'rejected': len(rejected_tweets),
+                        'pass_rate': len(passed_tweets) / analyzed_count,
+                        'avg_value_score': passed_score_sum / len(passed_tweets)
+                    }
+                }, output_file))
+            for future in writes:
+                future.result()
 
         if rejected_tweets:
-            rejected_file = input_file.replace('/raw/', '/rejected/analyzer_')
-            self.save_json({
-                **data,
-                'tweets': rejected_tweets,
-                'rejection_stats': {
-                    'total': len(tweets),
-                    'rejected': len(rejected_tweets),
-                    'stage': 'content_analyzer'
-                }
-            }, rejected_file)
-            self.logger.info(f"保存被拒绝数据: {rejected_file}")
+            self.logger.info(f"追加被拒绝记录 {len(rejected_tweets)} 条: {rejected_file}")
 
         if not passed_tweets:
             self.logger.info("无高价值AI内容")
             return None
 
-        output_file = input_file.replace('/raw/', '/evaluated/')
-        self.save_json({
-            **data,
-            'tweets': passed_tweets,
-            'analysis_stats': {
-                'total': len(tweets),
-                'passed': len(passed_tweets),
-                'rejected': len(rejected_tweets),
-                'pass_rate': len(passed_tweets) / len(tweets),
-                'avg_value_score': sum(t['value']['score'] for t in passed_tweets) / len(passed_tweets)
-            }
-        }, output_file)
-
         return output_file
@@ -1,13 +1,48 @@
 """评估模块 - 判断内容价值"""
 
-import json
+import asyncio
 from typing import Any, Optional
 
-from google import genai
-from google.genai import types
-from openai import OpenAI
-
 from .base import BaseModule
+from .llm_client import call_with_retry, get_client, parse_llm_json, run_async
+from .result_cache import ResultCache, normalize_content
+
+# 评估提示词版本，修改提示词时递增，使旧的缓存结果失效
+EVALUATION_PROMPT_VERSION = 2
+
+# 提示词固定部分放在最前面，各批次共享相同前缀，可命中服务商的前缀缓存
+EVALUATION_PROMPT_PREFIX = """评估一批 AI 相关推文的内容价值。
+
+请对每条推文从以下5个维度评分（每个维度 1-10 分）：
+1. **原创性 (Originality)**: 是原创内容还是转发/搬运？
+2. **信息量 (Information)**: 是否包含实质性信息？
+3. **深度 (Depth)**: 是浅层讨论还是深度分析？
+4. **时效性 (Timeliness)**: 是新鲜资讯还是旧闻？
+5. **可操作性 (Actionable)**: 读者能从中获得什么实用价值？
+
+综合评分：1-10 分
+- 8-10: 高价值，必须保留
+- 5-7:  中等价值，值得保留
+- 1-4:  低价值，可以过滤
+
+请以 JSON 格式回复，results 中每条推文一项，id 为推文编号：
+{
+  "results": [
+    {
+      "id": 推文编号,
+      "score": 综合评分,
+      "dimensions": {
+        "originality": 分数,
+        "information": 分数,
+        "depth": 分数,
+        "timeliness": 分数,
+        "actionable": 分数
+      },
+      "reason": "简短说明评分理由"
+    }
+  ]
+}
+"""
 
 DEFAULT_EVALUATION = {
     'score': 5,
@@ -25,11 +60,27 @@ class Evaluator(BaseModule):
         self.provider = self.config.get('llm_provider', 'openai')
         self.model = self.config['llm_model']
         self.auto_filter_config = self.config.get('auto_filter', {})
+        self.batch_size = self.config.get('batch_size', 10)
+        self.max_concurrency = self.config.get('max_concurrency', 8)
+        self.max_retries = self.config.get('max_retries', 4)
 
         if self.provider == 'gemini':
-            self.client = genai.Client(api_key=self.config['gemini_api_key'])
-        else:
-            self.client = OpenAI(api_key=self.config['openai_api_key'])
+            from google.genai import types
+            self._types = types
+
+        api_key_field = 'gemini_api_key' if self.provider == 'gemini' else 'openai_api_key'
+        self.client = get_client(self.provider, self.config[api_key_field])
+
+        # 按归一化内容缓存评估结果，转发/重复内容跨运行不再调用LLM
+        # 使用独立文件：ResultCache 的条数上限和过期清理作用于整个文件，与分析缓存共用会互相淘汰
+        self.cache = None
+        if self.config.get('use_cache', True):
+            self.cache = ResultCache(
+                self.config.get('cache_file', 'data/eval_cache.sqlite'),
+                namespace=f"{self.provider}:{self.model}:evaluation-v{EVALUATION_PROMPT_VERSION}",
+                max_entries=self.config.get('cache_max_entries'),
+                ttl_days=self.config.get('cache_ttl_days', 30)
+            )
 
     def _auto_filter(self, tweet: dict[str, Any]) -> bool:
         """自动过滤低质量内容，True 表示需要过滤"""
@@ -47,20 +98,24 @@ class Evaluator(BaseModule):
 
         return False
 
-    def _call_llm(self, prompt: str) -> str:
-        """调用LLM获取JSON响应"""
+    async def _call_llm(self, prompt: str) -> str:
+        """调用LLM获取JSON响应，遇到限流/服务端错误时指数退避重试"""
+        return await call_with_retry(lambda: self._request_llm(prompt), self.max_retries, self.logger)
+
+    async def _request_llm(self, prompt: str) -> str:
+        """发送单次LLM请求"""
         if self.provider == 'gemini':
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config=types.GenerateContentConfig(
+                config=self._types.GenerateContentConfig(
                     temperature=0.3,
                     response_mime_type='application/json'
                 )
             )
             return response.text.strip()
         else:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的内容价值评估专家。"},
@@ -71,65 +126,103 @@ class Evaluator(BaseModule):
             )
             return response.choices[0].message.content
 
-    def _evaluate_value(self, tweet: dict[str, Any]) -> dict[str, Any]:
-        """评估内容价值"""
+    def _format_tweet(self, index: int, tweet: dict[str, Any]) -> str:
+        """格式化单条推文（带编号）"""
         user = tweet['user']
-
-        prompt = f"""评估以下 AI 相关推文的内容价值。
-
+        return f"""【推文 {index}】
 作者: @{user['username']} (粉丝: {user['followers']})
 内容:
 {tweet['content']}
+互动: 回复 {tweet['replyCount']} | 转发 {tweet['retweetCount']} | 点赞 {tweet['likeCount']}
+"""
 
-互动数据:
-- 回复: {tweet['replyCount']}
-- 转发: {tweet['retweetCount']}
-- 点赞: {tweet['likeCount']}
+    async def _evaluate_batch(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        批量评估多条推文的内容价值（一次调用，结果按 id 对齐）
 
-请从以下5个维度评分（每个维度 1-10 分）：
-1. **原创性 (Originality)**: 是原创内容还是转发/搬运？
-2. **信息量 (Information)**: 是否包含实质性信息？
-3. **深度 (Depth)**: 是浅层讨论还是深度分析？
-4. **时效性 (Timeliness)**: 是新鲜资讯还是旧闻？
-5. **可操作性 (Actionable)**: 读者能从中获得什么实用价值？
+        返回内容无法解析时二分重试；个别条目缺失或无效时只重新评估这几条。
+        """
+        if not tweets:
+            return []
 
-综合评分：1-10 分
-- 8-10: 高价值，必须保留
-- 5-7:  中等价值，值得保留
-- 1-4:  低价值，可以过滤
-
-请以 JSON 格式回复：
-{{
-  "score": 综合评分,
-  "dimensions": {{
-    "originality": 分数,
-    "information": 分数,
-    "depth": 分数,
-    "timeliness": 分数,
-    "actionable": 分数
-  }},
-  "reason": "简短说明评分理由"
-}}"""
+        parts = [EVALUATION_PROMPT_PREFIX, f"以下是需要评估的{len(tweets)}条推文：\n"]
+        append = parts.append
+        for i, tweet in enumerate(tweets, 1):
+            append(self._format_tweet(i, tweet))
+        prompt = "\n".join(parts)
 
         try:
-            return json.loads(self._call_llm(prompt))
+            response = await self._call_llm(prompt)
         except Exception as e:
+            # 重试耗尽仍失败，拆分也无济于事
             self.logger.error(f"评估失败: {e}")
-            return {**DEFAULT_EVALUATION, 'reason': f'Error: {e}'}
-
-    def _evaluate_tweet(self, tweet: dict[str, Any]) -> Optional[dict[str, Any]]:
-        """评估单条推文，返回添加了 value 字段的推文或 None"""
-        if self._auto_filter(tweet):
-            return None
+            return [{**DEFAULT_EVALUATION, 'reason': f'Error: {e}', 'error': True} for _ in tweets]
 
-        result = self._evaluate_value(tweet)
-
-        if result['score'] < self.threshold:
-            self.logger.debug(f"价值过低: {tweet['id_str']}, score={result['score']}")
-            return None
-
-        tweet['value'] = result
-        return tweet
+        try:
+            results = self._align_results(parse_llm_json(response, self.logger), len(tweets))
+        except ValueError as e:
+            if len(tweets) > 1:
+                mid = len(tweets) // 2
+                self.logger.warning(f"批量结果解析失败({len(tweets)}条)，拆分为 {mid}+{len(tweets) - mid} 条重试: {e}")
+                # 顺序重试：调用方只持有一个并发名额
+                return await self._evaluate_batch(tweets[:mid]) + await self._evaluate_batch(tweets[mid:])
+            self.logger.error(f"评估结果解析失败: {e}")
+            return [{**DEFAULT_EVALUATION, 'reason': f'Error: {e}', 'error': True}]
+
+        failed = [i for i, result in enumerate(results) if result.get('error')]
+        if failed and len(failed) < len(tweets):
+            retried = await self._evaluate_batch([tweets[i] for i in failed])
+            for i, result in zip(failed, retried):
+                results[i] = result
+        return results
+
+    def _align_results(self, parsed: Any, count: int) -> list[dict[str, Any]]:
+        """按结果中的 id（从1开始）对齐到输入顺序，缺失的条目用默认结果补齐"""
+        if isinstance(parsed, dict):
+            parsed = parsed.get('results')
+        if not isinstance(parsed, list) or not any(isinstance(r, dict) for r in parsed):
+            raise ValueError("评估结果不是对象数组")
+
+        aligned: list[Optional[dict[str, Any]]] = [None] * count
+        for position, result in enumerate(parsed[:count]):
+            if not isinstance(result, dict):
+                continue
+            index = result.get('id')
+            if not isinstance(index, int) or not 1 <= index <= count or aligned[index - 1] is not None:
+                index = position + 1
+            if aligned[index - 1] is None:
+                aligned[index - 1] = result
+
+        missing = aligned.count(None)
+        if missing:
+            self.logger.warning(f"批量结果数量不匹配: 期望{count}, 缺失{missing}")
+
+        return [self._to_evaluation(result) for result in aligned]
+
+    @staticmethod
+    def _to_evaluation(result: Optional[dict[str, Any]]) -> dict[str, Any]:
+        """只保留 score / dimensions / reason；缺失或没有有效评分时返回带 error 标记的默认结果"""
+        if result is None or not isinstance(result.get('score'), (int, float)):
+            return {**DEFAULT_EVALUATION, 'reason': '评估结果缺失', 'error': True}
+        return {
+            'score': result['score'],
+            'dimensions': result.get('dimensions') or {},
+            'reason': result.get('reason', '')
+        }
+
+    async def _evaluate_all(self, tweets: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """并发评估所有批次，结果按原顺序返回"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        starts = range(0, len(tweets), self.batch_size)
+
+        async def evaluate(start: int) -> list[dict[str, Any]]:
+            batch = tweets[start:start + self.batch_size]
+            async with semaphore:
+                self.logger.info(f"处理批次: {start + 1}-{start + len(batch)}/{len(tweets)}")
+                return await self._evaluate_batch(batch)
+
+        results = await asyncio.gather(*(evaluate(start) for start in starts))
+        return [result for batch_results in results for result in batch_results]
 
     def run(self, input_file: str) -> Optional[str]:
         """运行评估"""
@@ -144,17 +237,55 @@ class Evaluator(BaseModule):
         evaluated_tweets = []
         rejected_tweets = []
 
-        for i, tweet in enumerate(tweets, 1):
-            if i % 5 == 0:
-                self.logger.info(f"处理进度: {i}/{len(tweets)}")
-
-            evaluated = self._evaluate_tweet(tweet)
-            if evaluated:
-                evaluated_tweets.append(evaluated)
+        # 自动过滤的推文不进入提示词
+        candidates = []
+        for tweet in tweets:
+            if self._auto_filter(tweet):
+                rejected_tweets.append(tweet)
             else:
+                candidates.append(tweet)
+
+        # 相同内容只评估一次，缓存命中的直接复用
+        keys = [normalize_content(tweet['content']) for tweet in candidates]
+        known = {
+            key: self._to_evaluation(result)
+            for key, result in (self.cache.get_many(keys) if self.cache else {}).items()
+        }
+        if known:
+            self.logger.info(f"缓存命中 {len(known)} 条")
+        misses = {}
+        for key, tweet in zip(keys, candidates):
+            if key not in known:
+                misses.setdefault(key, tweet)
+
+        if misses:
+            results = run_async(self._evaluate_all(list(misses.values())))
+            new_results = dict(zip(misses, results))
+            known.update(new_results)
+            if self.cache:
+                self.cache.put_many(
+                    (key, result) for key, result in new_results.items() if not result.get('error')
+                )
+
+        score_sum = 0
+        failed = 0
+        for tweet, key in zip(candidates, keys):
+            result = known[key]
+            if result.get('error'):
+                # 评估失败的推文不按默认分数放行
+                failed += 1
                 rejected_tweets.append(tweet)
+            elif result['score'] < self.threshold:
+                self.logger.debug(f"价值过低: {tweet['id_str']}, score={result['score']}")
+                rejected_tweets.append(tweet)
+            else:
+                tweet['value'] = result
+                evaluated_tweets.append(tweet)
+                score_sum += result['score']
 
         self.logger.info(f"评估完成: {len(evaluated_tweets)}/{len(tweets)} 条推文通过")
+        if failed:
+            self.logger.warning(f"{failed} 条推文评估失败，已归入被拒绝数据")
 
         if rejected_tweets:
             rejected_file = input_file.replace('/filtered/', '/rejected/evaluator_')
@@ -182,7 +313,7 @@ class Evaluator(BaseModule):
                 'evaluated': len(evaluated_tweets),
                 'rejected': len(rejected_tweets),
                 'ratio': len(evaluated_tweets) / len(tweets),
-                'avg_score': sum(t['value']['score'] for t in evaluated_tweets) / len(evaluated_tweets)
+                'avg_score': score_sum / len(evaluated_tweets)
             }
         }, output_file)
 
@@ -1,11 +1,16 @@
 """事件写入器 - 用于可视化前端的事件流"""
 
-import json
+import atexit
 import os
 import time
 from datetime import datetime
 from typing import Any, Optional
 
+from .base import json_dumps
+
+# 每累计多少条事件刷新一次文件缓冲
+EVENT_FLUSH_INTERVAL = 50
+
 
 class EventEmitter:
     """
@@ -13,17 +18,21 @@ class EventEmitter:
 
     - Pipeline 可选择是否使用
     - 不使用时不影响任何功能
-    - 事件以 JSONL 格式追加写入
+    - 事件以 JSONL 格式追加写入，文件句柄常驻并缓冲，
+      每 EVENT_FLUSH_INTERVAL 条、管道结束或进程退出时刷新
     """
 
     def __init__(self, run_id: Optional[str] = None):
         self.run_id = run_id or self._generate_run_id()
         self.events_dir = "data/events"
         self.event_file = os.path.join(self.events_dir, f"{self.run_id}.jsonl")
-        self.start_time = time.time()
+        self.start_time_ns = time.monotonic_ns()
 
         # 确保目录存在
         os.makedirs(self.events_dir, exist_ok=True)
+        self._file = open(self.event_file, 'ab', buffering=64 * 1024)
+        self._pending = 0
+        atexit.register(self.close)
 
     def _generate_run_id(self) -> str:
         """生成运行 ID: YYYY-MM-DD_HHmmss"""
@@ -40,12 +49,26 @@ class EventEmitter:
         event = {
             "type": event_type,
             "data": data or {},
-            "elapsed_ms": int((time.time() - self.start_time) * 1000),
+            "elapsed_ms": (time.monotonic_ns() - self.start_time_ns) // 1_000_000,
             "timestamp": datetime.now().isoformat()
         }
 
-        with open(self.event_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self._file.write(json_dumps(event, indent=False) + b'\n')
+        self._pending += 1
+        if self._pending >= EVENT_FLUSH_INTERVAL or event_type in (EventType.PIPELINE_DONE, EventType.PIPELINE_ERROR):
+            self.flush()
+
+    def flush(self) -> None:
+        """把缓冲中的事件写入文件"""
+        if not self._file.closed:
+            self._file.flush()
+        self._pending = 0
+
+    def close(self) -> None:
+        """刷新并关闭事件文件"""
+        if not self._file.closed:
+            self._file.close()
+        atexit.unregister(self.close)
 
     def get_event_file(self) -> str:
         """获取事件文件路径"""
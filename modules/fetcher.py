@@ -1,8 +1,8 @@
 """抓取模块 - 从 Twitter List 抓取推文"""
 
-import asyncio
 import sys
 from datetime import datetime
+from operator import attrgetter
 from pathlib import Path
 from typing import Any, Optional
 
@@ -10,6 +10,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent / 'twscrape'))
 from twscrape import API
 
 from .base import BaseModule
+from .llm_client import run_async
+
+# 输出字段名与 twscrape 属性名一一对应，attrgetter 在 C 层一次取出全部属性
+_TWEET_FIELDS = ('id', 'id_str', 'url', 'date', 'content', 'lang',
+                 'replyCount', 'retweetCount', 'likeCount', 'quoteCount')
+_TWEET_ATTRS = attrgetter('id', 'id_str', 'url', 'date', 'rawContent', 'lang',
+                          'replyCount', 'retweetCount', 'likeCount', 'quoteCount')
+_USER_FIELDS = ('id', 'username', 'displayname', 'followers')
+_USER_ATTRS = attrgetter('id', 'username', 'displayname', 'followersCount')
 
 
 class Fetcher(BaseModule):
@@ -20,6 +29,7 @@ class Fetcher(BaseModule):
         self.api = API(self.config['db_path'], debug=False)
         self.list_id = self.config['list_id']
         self.max_tweets = self.config['max_tweets_per_run']
+        self.strict_incremental = self.config.get('strict_incremental', True)
 
     def _load_state(self) -> dict[str, Any]:
         """加载状态文件"""
@@ -35,28 +45,14 @@ class Fetcher(BaseModule):
 
     def _extract_tweet_data(self, tweet: Any) -> dict[str, Any]:
         """从推文对象提取需要的字段"""
-        return {
-            'id': tweet.id,
-            'id_str': tweet.id_str,
-            'url': tweet.url,
-            'date': tweet.date.isoformat(),
-            'user': {
-                'id': tweet.user.id,
-                'username': tweet.user.username,
-                'displayname': tweet.user.displayname,
-                'followers': tweet.user.followersCount,
-            },
-            'content': tweet.rawContent,
-            'lang': tweet.lang,
-            'replyCount': tweet.replyCount,
-            'retweetCount': tweet.retweetCount,
-            'likeCount': tweet.likeCount,
-            'quoteCount': tweet.quoteCount,
-            'viewCount': getattr(tweet, 'viewCount', 0),
-            'isReply': getattr(tweet, 'inReplyToTweetId', None) is not None,
-            'isRetweet': tweet.retweetedTweet is not None,
-            'hasMedia': bool(tweet.media and (tweet.media.photos or tweet.media.videos)),
-        }
+        # date 保留 datetime，由 save_json 直接输出 ISO 8601
+        data = dict(zip(_TWEET_FIELDS, _TWEET_ATTRS(tweet)))
+        data['user'] = dict(zip(_USER_FIELDS, _USER_ATTRS(tweet.user)))
+        data['viewCount'] = getattr(tweet, 'viewCount', 0)
+        data['isReply'] = getattr(tweet, 'inReplyToTweetId', None) is not None
+        data['isRetweet'] = tweet.retweetedTweet is not None
+        data['hasMedia'] = bool(tweet.media and (tweet.media.photos or tweet.media.videos))
+        return data
 
     async def _fetch_tweets(self, since_id: Optional[int] = None) -> list[dict[str, Any]]:
         """抓取推文（增量抓取，只获取新推文）"""
@@ -74,6 +70,10 @@ class Fetcher(BaseModule):
         try:
             async for tweet in self.api.list_timeline(self.list_id, limit=self.max_tweets * 2):
                 if since_id and tweet.id <= since_id:
+                    # 时间线按新到旧返回，之后的推文都已抓取过，不必继续翻页
+                    if self.strict_incremental:
+                        self.logger.info(f"遇到已抓取推文 (ID: {tweet.id})，提前终止抓取")
+                        break
                     if skipped == 0:
                         self.logger.info(f"遇到已抓取推文 (ID: {tweet.id})，跳过后续旧推文")
                     skipped += 1
@@ -104,7 +104,7 @@ class Fetcher(BaseModule):
         if since_id and isinstance(since_id, str):
             since_id = int(since_id)
 
-        tweets = asyncio.run(self._fetch_tweets(since_id))
+        tweets = run_async(self._fetch_tweets(since_id))
 
         if not tweets:
             self.logger.info("无新推文")
@@ -1,13 +1,11 @@
 """过滤模块 - 判断推文是否与 AI 相关"""
 
-import json
+import asyncio
+import re
 from typing import Any, Optional
 
-from google import genai
-from google.genai import types
-from openai import OpenAI
-
 from .base import BaseModule
+from .llm_client import call_with_retry, get_client, parse_llm_json, run_async
 
 DEFAULT_FILTER_RESULT = {
     'is_relevant': False,
@@ -15,6 +13,23 @@ DEFAULT_FILTER_RESULT = {
     'reason': ''
 }
 
+# 批量判断提示词的固定部分放在最前面，各批次共享相同前缀
+BATCH_PROMPT_PREFIX = """判断以下每条推文内容是否与人工智能(AI)相关。
+
+对每条推文分析：
+1. 是否讨论 AI、机器学习、大模型、或相关技术？
+2. 相关性评分 (0-100分，0表示完全无关，100表示高度相关)
+3. 简短说明判断理由
+
+请以 JSON 格式回复，results 中每条推文一项，id 为推文编号：
+{
+  "results": [
+    {"id": 推文编号, "is_relevant": true/false, "score": 分数, "reason": "理由"}
+  ]
+}
+
+"""
+
 
 class Filter(BaseModule):
     """AI 相关性过滤模块"""
@@ -22,34 +37,46 @@ class Filter(BaseModule):
     def __init__(self, config_path: str = "config/filter.yaml") -> None:
         super().__init__(config_path)
         self.keywords = self.config['keywords']
+        # 关键词统一转小写后合并成一个正则，每条推文只扫描一遍
+        self._keyword_re = re.compile(
+            '|'.join(re.escape(kw.lower()) for kw in self.keywords)
+        ) if self.keywords else None
         self.threshold = self.config['relevance_threshold']
         self.provider = self.config.get('llm_provider', 'openai')
         self.model = self.config['llm_model']
+        self.batch_size = self.config.get('batch_size', 10)
+        self.max_concurrency = self.config.get('max_concurrency', 8)
+        self.max_retries = self.config.get('max_retries', 4)
 
         if self.provider == 'gemini':
-            self.client = genai.Client(api_key=self.config['gemini_api_key'])
-        else:
-            self.client = OpenAI(api_key=self.config['openai_api_key'])
+            from google.genai import types
+            self._types = types
+
+        api_key_field = 'gemini_api_key' if self.provider == 'gemini' else 'openai_api_key'
+        self.client = get_client(self.provider, self.config[api_key_field])
 
     def _keyword_filter(self, content: str) -> bool:
         """第一层：关键词快速过滤，True 表示可能相关"""
-        content_lower = content.lower()
-        return any(kw.lower() in content_lower for kw in self.keywords)
+        return self._keyword_re is not None and self._keyword_re.search(content.lower()) is not None
 
-    def _call_llm(self, prompt: str) -> str:
-        """调用LLM获取JSON响应"""
+    async def _call_llm(self, prompt: str) -> str:
+        """调用LLM获取JSON响应，遇到限流/服务端错误时指数退避重试"""
+        return await call_with_retry(lambda: self._request_llm(prompt), self.max_retries, self.logger)
+
+    async def _request_llm(self, prompt: str) -> str:
+        """发送单次LLM请求"""
         if self.provider == 'gemini':
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config=types.GenerateContentConfig(
+                config=self._types.GenerateContentConfig(
                     temperature=0.3,
                     response_mime_type='application/json'
                 )
             )
             return response.text.strip()
         else:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的 AI 内容分析助手。"},
@@ -60,7 +87,7 @@ class Filter(BaseModule):
             )
             return response.choices[0].message.content
 
-    def _llm_filter(self, content: str) -> dict[str, Any]:
+    async def _llm_filter(self, content: str) -> dict[str, Any]:
         """第二层：LLM 判断相关性"""
         prompt = f"""判断以下推文内容是否与人工智能(AI)相关。
 
@@ -80,27 +107,74 @@ class Filter(BaseModule):
 }}"""
 
         try:
-            return json.loads(self._call_llm(prompt))
+            result = parse_llm_json(await self._call_llm(prompt), self.logger)
         except Exception as e:
             self.logger.error(f"LLM 调用失败: {e}")
             return {**DEFAULT_FILTER_RESULT, 'reason': f'Error: {e}'}
+        if not self._is_valid_result(result):
+            self.logger.error(f"LLM 返回结构异常: {result}")
+            return {**DEFAULT_FILTER_RESULT, 'reason': 'Error: 返回结构异常'}
+        return result
+
+    @staticmethod
+    def _is_valid_result(result: Any) -> bool:
+        """检查单条判断结果是否包含 run() 需要的字段且类型正确"""
+        return (
+            isinstance(result, dict)
+            and isinstance(result.get('is_relevant'), bool)
+            and isinstance(result.get('score'), (int, float))
+            and not isinstance(result.get('score'), bool)
+            and isinstance(result.get('reason'), str)
+        )
+
+    async def _llm_filter_batch(self, contents: list[str]) -> list[dict[str, Any]]:
+        """一次调用判断多条推文的相关性；返回条数或编号对不上时逐条重新判断，个别结果字段缺失时只重判这几条"""
+        if len(contents) == 1:
+            return [await self._llm_filter(contents[0])]
+
+        parts = [BATCH_PROMPT_PREFIX, f"以下是需要判断的{len(contents)}条推文：\n\n"]
+        append = parts.append
+        for i, content in enumerate(contents, 1):
+            append(f"【推文{i}】\n{content}\n\n")
 
-    def _filter_tweet(self, tweet: dict[str, Any]) -> Optional[dict[str, Any]]:
-        """过滤单条推文，返回添加了 relevance 字段的推文或 None"""
-        content = tweet['content']
+        try:
+            parsed = parse_llm_json(await self._call_llm(''.join(parts)), self.logger)
+            results = parsed.get('results') if isinstance(parsed, dict) else parsed
+            if isinstance(results, list) and all(isinstance(r, dict) for r in results):
+                by_id = {r.get('id'): r for r in results}
+                if len(results) == len(contents) and all(i in by_id for i in range(1, len(contents) + 1)):
+                    aligned = [by_id[i] for i in range(1, len(contents) + 1)]
+                    invalid = [i for i, r in enumerate(aligned) if not self._is_valid_result(r)]
+                    if invalid:
+                        self.logger.warning(f"批量结果中{len(invalid)}条结构异常，逐条重新判断")
+                    # 逐条顺序重试：调用方只持有一个并发名额，不能在这里再并发展开
+                    for i in invalid:
+                        aligned[i] = await self._llm_filter(contents[i])
+                    return aligned
+            self.logger.warning(f"批量结果与输入不匹配（期望{len(contents)}条），逐条重新判断")
+        except Exception as e:
+            self.logger.warning(f"批量判断失败: {e}，逐条重新判断")
 
-        if not self._keyword_filter(content):
-            self.logger.debug(f"关键词过滤: {tweet['id_str']}")
-            return None
+        return [await self._llm_filter(content) for content in contents]
 
-        result = self._llm_filter(content)
+    async def _llm_filter_all(self, contents: list[str]) -> list[dict[str, Any]]:
+        """按 batch_size 分批并发判断，结果按输入顺序返回"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        done = 0
 
-        if not result['is_relevant'] or result['score'] < self.threshold:
-            self.logger.debug(f"LLM 过滤: {tweet['id_str']}, score={result['score']}")
-            return None
+        async def judge(batch: list[str]) -> list[dict[str, Any]]:
+            nonlocal done
+            async with semaphore:
+                results = await self._llm_filter_batch(batch)
+            done += len(batch)
+            self.logger.info(f"处理进度: {done}/{len(contents)}")
+            return results
 
-        tweet['relevance'] = {'score': result['score'], 'reason': result['reason']}
-        return tweet
+        batches = await asyncio.gather(*(
+            judge(contents[start:start + self.batch_size])
+            for start in range(0, len(contents), self.batch_size)
+        ))
+        return [result for results in batches for result in results]
 
     def run(self, input_file: str) -> Optional[str]:
         """运行过滤"""
@@ -115,15 +189,29 @@ class Filter(BaseModule):
         filtered_tweets = []
         rejected_tweets = []
 
-        for i, tweet in enumerate(tweets, 1):
-            if i % 10 == 0:
-                self.logger.info(f"处理进度: {i}/{len(tweets)}")
-
-            filtered = self._filter_tweet(tweet)
-            if filtered:
-                filtered_tweets.append(filtered)
+        # 第一层关键词过滤，只有可能相关的推文进入 LLM 判断
+        candidates = []
+        for i, tweet in enumerate(tweets):
+            if self._keyword_filter(tweet['content']):
+                candidates.append(i)
             else:
+                self.logger.debug(f"关键词过滤: {tweet['id_str']}")
+
+        verdicts: list[Optional[dict[str, Any]]] = [None] * len(tweets)
+        if candidates:
+            results = run_async(self._llm_filter_all([tweets[i]['content'] for i in candidates]))
+            for i, result in zip(candidates, results):
+                verdicts[i] = result
+
+        for tweet, result in zip(tweets, verdicts):
+            if result is None:
                 rejected_tweets.append(tweet)
+            elif not result['is_relevant'] or result['score'] < self.threshold:
+                self.logger.debug(f"LLM 过滤: {tweet['id_str']}, score={result['score']}")
+                rejected_tweets.append(tweet)
+            else:
+                tweet['relevance'] = {'score': result['score'], 'reason': result['reason']}
+                filtered_tweets.append(tweet)
 
         self.logger.info(f"过滤完成: {len(filtered_tweets)}/{len(tweets)} 条推文通过")
 
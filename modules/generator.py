@@ -1,11 +1,12 @@
 """生成模块 - 生成 Markdown 文件"""
 
+import os
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, TextIO
 
-from .base import BaseModule
+from .base import BaseModule, ensure_parent_dir
 
 CATEGORY_EMOJI = {
     '时闻': '\U0001F525',
@@ -34,63 +35,56 @@ class Generator(BaseModule):
             grouped[tweet['classification']['category']].append(tweet)
         return dict(grouped)
 
-    def _generate_tweet_section(self, tweet: dict[str, Any], index: int) -> str:
-        """生成单条推文的 Markdown 片段"""
+    def _write_tweet_section(self, out: TextIO, tweet: dict[str, Any], index: int) -> None:
+        """写出单条推文的 Markdown 片段（以换行结尾）"""
         cls = tweet['classification']
         value = tweet['value']
         user = tweet['user']
+        write = out.write
 
-        lines = [
-            f"### {index}. {cls['summary']}\n",
-            f"- **来源**: [@{user['username']}]({tweet['url']}) ({user['displayname']})",
-            f"- **时间**: {tweet['date'][:19].replace('T', ' ')}",
-            f"- **价值评分**: {value['score']}/10",
-        ]
+        write(f"### {index}. {cls['summary']}\n\n")
+        write(f"- **来源**: [@{user['username']}]({tweet['url']}) ({user['displayname']})\n")
+        write(f"- **时间**: {tweet['date'][:19].replace('T', ' ')}\n")
+        write(f"- **价值评分**: {value['score']}/10\n")
 
         if self.include_links:
-            lines.append(f"- **原文**: {tweet['url']}")
+            write(f"- **原文**: {tweet['url']}\n")
 
         if cls.get('key_points'):
-            lines.append("\n**要点**:")
-            lines.extend(f"  - {point}" for point in cls['key_points'])
+            write("\n**要点**:\n")
+            for point in cls['key_points']:
+                write(f"  - {point}\n")
 
-        lines.extend([
-            "\n<details>",
-            "<summary>查看原文</summary>\n",
-            f"{tweet['content']}\n",
-            "</details>\n"
-        ])
+        write(f"\n<details>\n<summary>查看原文</summary>\n\n{tweet['content']}\n\n</details>\n\n")
 
-        return "\n".join(lines)
-
-    def _generate_markdown(self, data: dict[str, Any]) -> str:
-        """生成完整的 Markdown"""
+    def _write_markdown(self, out: TextIO, data: dict[str, Any]) -> None:
+        """把完整的 Markdown 逐段写入 out"""
         tweets = data['tweets']
         fetch_time = data.get('fetch_time', datetime.now().isoformat())
-
-        lines = []
+        write = out.write
 
         if self.include_metadata:
-            lines.extend([
-                "---",
-                f"generated_at: {datetime.now().isoformat()}",
-                "source_list: MY AI LIST",
-                f"tweet_count: {len(tweets)}",
-                f"period: {fetch_time[:13]}:00 - {fetch_time[:13]}:59",
-                "---\n",
-            ])
+            write(
+                "---\n"
+                f"generated_at: {datetime.now().isoformat()}\n"
+                "source_list: MY AI LIST\n"
+                f"tweet_count: {len(tweets)}\n"
+                f"period: {fetch_time[:13]}:00 - {fetch_time[:13]}:59\n"
+                "---\n\n"
+            )
 
         period_str = fetch_time[:13].replace('T', ' ')
-        lines.append(f"# AI 资讯摘要 ({period_str}:00)\n")
+        write(f"# AI 资讯摘要 ({period_str}:00)\n\n")
 
         if data.get('category_stats'):
-            lines.append("## \U0001F4CA 本期统计\n")
+            write("## \U0001F4CA 本期统计\n\n")
             for cat, count in data['category_stats'].items():
                 emoji = CATEGORY_EMOJI.get(cat, '\U0001F4CC')
-                lines.append(f"- {emoji} {cat}: {count} 条")
-            lines.append("")
+                write(f"- {emoji} {cat}: {count} 条\n")
+            write("\n")
 
-        grouped = self._group_by_category(tweets)
+        # 整体按价值评分排序一次再分组，各分类内的顺序随之有序（排序稳定，同分保持原顺序）
+        grouped = self._group_by_category(sorted(tweets, key=lambda t: t['value']['score'], reverse=True))
 
         for category in CATEGORY_ORDER:
             if category not in grouped:
@@ -99,19 +93,16 @@ class Generator(BaseModule):
             cat_tweets = grouped[category]
             emoji = CATEGORY_EMOJI.get(category, '\U0001F4CC')
 
-            lines.append(f"\n## {emoji} {category} ({len(cat_tweets)}条)\n")
+            write(f"\n## {emoji} {category} ({len(cat_tweets)}条)\n\n")
 
-            sorted_tweets = sorted(cat_tweets, key=lambda t: t['value']['score'], reverse=True)
-            for i, tweet in enumerate(sorted_tweets, 1):
-                lines.append(self._generate_tweet_section(tweet, i))
+            for i, tweet in enumerate(cat_tweets, 1):
+                self._write_tweet_section(out, tweet, i)
 
-        lines.extend([
-            "\n---",
-            "\n\U0001F916 本文由 AI 推文抓取系统自动生成",
+        write(
+            "\n---\n"
+            "\n\U0001F916 本文由 AI 推文抓取系统自动生成\n"
             f"\n\U0001F4C5 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        ])
-
-        return "\n".join(lines)
+        )
 
     def run(self, input_file: str) -> Optional[str]:
         """运行生成"""
@@ -122,14 +113,15 @@ class Generator(BaseModule):
 
         self.logger.info(f"开始生成 Markdown，共 {len(data['tweets'])} 条推文")
 
-        markdown = self._generate_markdown(data)
-
         output_file = input_file.replace('/classified/', '/output/').replace('.json', '.md')
         output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+        ensure_parent_dir(output_path)
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(markdown)
+        # 边生成边写入，不在内存中拼出整篇文档；写完再原子替换
+        tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            self._write_markdown(f, data)
+        os.replace(tmp_path, output_path)
 
         self.logger.info(f"Markdown 已生成: {output_file}")
         return output_file
@@ -1,12 +1,11 @@
 """KOL识别Agent - 自动识别重要KOL，避免误判"""
 
-import json
 from typing import Any, Optional
 
-from google import genai
 from google.genai import types
 
 from .base import BaseModule
+from .llm_client import get_client, parse_llm_json
 
 DEFAULT_KOL_RESULT = {
     'is_important_kol': False,
@@ -35,7 +34,7 @@ class KOLAgent(BaseModule):
         self.max_tweets = self.config.get('max_tweets', 10)
 
         if self.provider == 'gemini':
-            self.client = genai.Client(api_key=self.config['gemini_api_key'])
+            self.client = get_client('gemini', self.config['gemini_api_key'])
 
     def should_check(self, author_stats: dict[str, Any]) -> bool:
         """判断是否需要检查该博主（高粉丝 + 低通过率 + 样本不足）"""
@@ -94,7 +93,7 @@ recommendation说明：
                     response_mime_type='application/json'
                 )
             )
-            result = json.loads(response.text.strip())
+            result = parse_llm_json(response.text, self.logger)
             self.logger.info(
                 f"KOL识别 @{username}: {result.get('recommendation')} - {result.get('reason')}"
             )
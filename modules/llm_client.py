@@ -0,0 +1,172 @@
+"""LLM 客户端共享 - 进程内复用 SDK 客户端及其连接池"""
+
+import asyncio
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Iterable, Iterator, Optional, TypeVar
+
+from .base import json_loads
+
+try:
+    import uvloop
+except ImportError:  # 未安装 uvloop（或 Windows）时使用标准库事件循环
+    uvloop = None
+
+T = TypeVar('T')
+
+_CODE_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+
+# (provider, api_key) -> 客户端，多次构造模块时复用 TCP/TLS 连接
+_CLIENT_CACHE: dict[tuple[str, str], Any] = {}
+_CLIENT_LOCK = threading.Lock()
+
+# 异步客户端的连接池绑定在创建它的事件循环上，因此所有模块共用同一个循环
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client(provider: str, api_key: str) -> Any:
+    """
+    获取（或创建）指定 provider 的客户端：gemini 返回 genai.Client，其余返回 AsyncOpenAI
+
+    SDK 按需导入，只用一个 provider 时不必加载另一个（google.genai 会连带加载 protobuf 等）
+    """
+    key = (provider, api_key)
+    with _CLIENT_LOCK:
+        if key not in _CLIENT_CACHE:
+            if provider == 'gemini':
+                from google import genai
+                _CLIENT_CACHE[key] = genai.Client(api_key=api_key)
+            else:
+                from openai import AsyncOpenAI
+                _CLIENT_CACHE[key] = AsyncOpenAI(api_key=api_key)
+        return _CLIENT_CACHE[key]
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """在进程共享的事件循环上运行协程（替代每次新建循环的 asyncio.run），已安装 uvloop 时使用 uvloop"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（UTF-8 字节数 / 3：中文约1字1 token，英文约3字符1 token）"""
+    return len(text.encode('utf-8')) // 3
+
+
+def pack_batches(
+    items: Iterable[T],
+    estimate: Callable[[T], int],
+    max_tokens: int,
+    max_items: int
+) -> Iterator[list[T]]:
+    """按 token 预算贪心打包批次，每批不超过 max_tokens 且不超过 max_items 条"""
+    batch: list[T] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = estimate(item)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def parse_llm_json(text: str, logger: Optional[logging.Logger] = None) -> Any:
+    """
+    解析 LLM 返回的 JSON，失败时依次尝试去掉 ```json 代码块包裹、删除尾随逗号
+
+    常见的格式瑕疵在本地修复，不必重新请求；全部失败时抛出原始的 ValueError
+    """
+    try:
+        return json_loads(text)
+    except ValueError as error:
+        original = error
+
+    fence = _CODE_FENCE_RE.match(text)
+    if fence:
+        text = fence.group(1)
+        try:
+            result = json_loads(text)
+        except ValueError:
+            pass
+        else:
+            if logger:
+                logger.warning("LLM 返回的 JSON 带代码块包裹，已去除")
+            return result
+
+    try:
+        result = json_loads(_TRAILING_COMMA_RE.sub(r'\1', text))
+    except ValueError:
+        raise original
+    if logger:
+        logger.warning("LLM 返回的 JSON 含尾随逗号，已修复")
+    return result
+
+
+def is_transient(error: Exception) -> bool:
+    """判断是否为可重试的错误：限流(429)、服务端错误(5xx)、超时或连接错误"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # OpenAI SDK 的超时/连接错误没有状态码；SDK 按需导入，未加载时错误不可能来自它
+    openai = sys.modules.get('openai')
+    if openai is not None and isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    # OpenAI SDK 用 status_code，google-genai 用 code
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    return status == 429 or (isinstance(status, int) and 500 <= status < 600)
+
+
+async def call_with_retry(
+    request: Callable[[], Awaitable[T]],
+    max_retries: int,
+    logger: logging.Logger,
+    limiter: Optional['RateLimiter'] = None
+) -> T:
+    """
+    发送请求，遇到可重试错误时指数退避（2^n 秒 + 随机抖动）重试，最多尝试 max_retries 次（至少1次）
+
+    request 每次调用都应返回新的协程；非可重试错误或重试耗尽时原样抛出
+    """
+    max_retries = max(1, max_retries)
+    for attempt in range(max_retries):
+        if limiter:
+            await limiter.acquire()
+        try:
+            return await request()
+        except Exception as e:
+            if not is_transient(e) or attempt == max_retries - 1:
+                raise
+            delay = 2 ** attempt + random.random()
+            logger.warning(f"请求失败({e})，{delay:.1f}秒后重试 ({attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    异步请求限速器：按每分钟请求数均匀发放请求许可
+
+    与信号量互补——信号量限制同时在途的请求数，限速器限制单位时间内发出的请求数
+    """
+
+    def __init__(self, requests_per_minute: int) -> None:
+        self.interval = 60 / requests_per_minute
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        """等待下一个可用的请求时间片"""
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -7,10 +7,10 @@ import random
 from typing import Dict, Any, List, Optional
 from collections import defaultdict
 from datetime import datetime
-from google import genai
 from google.genai import types
 
 from .base import BaseModule
+from .llm_client import get_client
 
 
 class PipelineEvaluator(BaseModule):
@@ -22,7 +22,7 @@ class PipelineEvaluator(BaseModule):
         self.review_model = self.config.get('review_model', 'gemini-2.5-pro')
 
         # 使用更强的模型进行审查
-        self.client = genai.Client(api_key=self.config['gemini_api_key'])
+        self.client = get_client('gemini', self.config['gemini_api_key'])
 
     def _re_evaluate_filter(self, tweet: Dict[str, Any]) -> Dict[str, Any]:
         """
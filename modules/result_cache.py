@@ -0,0 +1,116 @@
+"""LLM 结果缓存 - 按内容哈希持久化到 SQLite，跨运行复用"""
+
+import hashlib
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from .base import json_dumps, json_loads
+
+# 转发推文内容的固定前缀 "RT @用户名: "
+RT_PREFIX = 'RT @'
+_RT_PREFIX_RE = re.compile(r'^RT @\w+:\s*')
+_URL_RE = re.compile(r'https?://\S+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_content(content: str) -> str:
+    """
+    归一化推文内容作为缓存键：去掉 RT 前缀和链接，合并空白
+
+    t.co 短链每次转发都不同，去掉后同一原文的转发/引用命中同一条缓存
+    """
+    if content.startswith(RT_PREFIX):
+        content = _RT_PREFIX_RE.sub('', content, count=1)
+    content = _URL_RE.sub('', content)
+    return _WHITESPACE_RE.sub(' ', content).strip()
+
+
+class ResultCache:
+    """
+    基于 SQLite 的 LLM 结果缓存
+
+    - 键为 blake2b(命名空间 + 内容)，命名空间区分模型和提示词版本
+    - WAL 模式，允许抓取/分析进程同时读写
+    - 批量写入在单个事务中提交
+    - 可选 max_entries 上限，超出时淘汰最早写入的条目
+    - 可选 ttl_days，打开时清理过期条目
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        namespace: str,
+        max_entries: Optional[int] = None,
+        ttl_days: Optional[float] = None
+    ) -> None:
+        path = Path(db_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_entries = max_entries
+        self._namespace = hashlib.blake2b(namespace.encode('utf-8'), digest_size=16).digest()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(hash BLOB PRIMARY KEY, result BLOB NOT NULL, ts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+        if 'ts' not in columns:
+            # 旧版缓存没有写入时间，迁移后视为已过期
+            self.conn.execute("ALTER TABLE results ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+
+        if ttl_days:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM results WHERE ts < ?", (int(time.time() - ttl_days * 86400),)
+                )
+
+    def _key(self, content: str) -> bytes:
+        return hashlib.blake2b(self._namespace + content.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, content: str) -> Optional[dict[str, Any]]:
+        """查询缓存，未命中返回 None"""
+        row = self.conn.execute(
+            "SELECT result FROM results WHERE hash = ?", (self._key(content),)
+        ).fetchone()
+        return json_loads(row[0]) if row else None
+
+    def get_many(self, contents: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """批量查询缓存，返回命中的 {内容: 结果}（按 500 个分块 IN 查询）"""
+        keys = {self._key(content): content for content in contents}
+        hits = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, result FROM results WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            for key, result in rows:
+                hits[keys[key]] = json_loads(result)
+        return hits
+
+    def put_many(self, items: Iterable[tuple[str, dict[str, Any]]]) -> None:
+        """批量写入 (内容, 结果)"""
+        now = int(time.time())
+        rows = [
+            (self._key(content), json_dumps(result, indent=False), now)
+            for content, result in items
+        ]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results (hash, result, ts) VALUES (?, ?, ?)", rows)
+            if self.max_entries:
+                # INSERT OR REPLACE 会为条目分配新的 rowid，rowid 越小写入越早
+                self.conn.execute(
+                    "DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?",
+                    (self.max_entries,)
+                )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,92 @@
+"""已处理推文ID存储 - SQLite 主键索引，增量写入"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+# 推文ID：抓取结果中为 int（twscrape Tweet.id），旧数据中可能是字符串
+TweetId = Union[int, str]
+
+
+class SeenStore:
+    """
+    基于 SQLite 的推文去重集合
+
+    - 成员查询走主键索引，无需每次启动加载全部ID
+    - 新ID在单个事务中批量追加，不再整表重写
+    - 可选 max_entries 上限，超出时淘汰最早写入的ID
+    - 首次启动时自动迁移旧版 JSON 文件
+    - ID 统一以十进制字符串存储，int 和 str 形式的同一ID视为相同
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: Optional[int] = None,
+        legacy_json: Optional[str] = None
+    ) -> None:
+        path = Path(db_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_entries = max_entries
+        # 允许在线程池中写回（同一时刻只有一个线程使用该连接）
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        # 不用 INTEGER PRIMARY KEY：那样 id 会成为 rowid，淘汰最早写入的条目依赖自增 rowid
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)")
+
+        if legacy_json:
+            self._migrate(Path(legacy_json))
+
+    def _migrate(self, legacy_path: Path) -> None:
+        """导入旧版 processed_ids.json，导入后重命名避免重复迁移"""
+        if not legacy_path.exists():
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                ids = json.load(f).get('ids', [])
+        except (json.JSONDecodeError, IOError):
+            return
+        self.add_many(ids)
+        legacy_path.rename(legacy_path.with_suffix('.json.migrated'))
+
+    def __contains__(self, tweet_id: TweetId) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM seen WHERE id = ?", (str(tweet_id),)
+        ).fetchone() is not None
+
+    def seen_among(self, ids: list[TweetId]) -> set[TweetId]:
+        """
+        一次性查询一组ID中已处理的部分（按 500 个分块，避开 SQLite 参数上限）
+
+        返回的是传入的原始ID对象（保持调用方的 int/str 类型），可直接用于 `tweet['id'] in seen`
+        """
+        by_key = {str(tweet_id): tweet_id for tweet_id in ids}
+        keys = list(by_key)
+        seen: set[TweetId] = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT id FROM seen WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            seen.update(by_key[row[0]] for row in rows)
+        return seen
+
+    def add_many(self, ids: Iterable[TweetId]) -> None:
+        """批量记录已处理ID"""
+        rows = [(str(tweet_id),) for tweet_id in ids]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO seen (id) VALUES (?)", rows)
+            if self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM seen WHERE rowid <= (SELECT MAX(rowid) FROM seen) - ?",
+                    (self.max_entries,)
+                )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -7,7 +7,7 @@ import traceback
 from datetime import datetime
 from typing import Any, Optional
 
-from modules import Fetcher, Classifier, Generator
+from modules import BaseModule, Fetcher, Classifier, Generator
 from modules.content_analyzer import ContentAnalyzer
 
 
@@ -288,9 +288,9 @@ class Pipeline:
         except Exception:
             return {}
 
-    def get_author_report(self, min_tweets: int = 3) -> dict:
+    def get_author_report(self, min_tweets: int = 3, top_n: Optional[int] = None) -> dict:
         """获取博主质量报告"""
-        return self.analyzer.get_author_report(min_tweets)
+        return self.analyzer.get_author_report(min_tweets, top_n=top_n)
 
     def print_author_report(self, min_tweets: int = 5) -> None:
         """打印博主质量报告"""
@@ -343,8 +343,10 @@ def main() -> None:
     parser.add_argument('--input', type=str, help='使用指定的原始数据文件')
     parser.add_argument('--author-report', action='store_true', help='生成博主质量报告')
     parser.add_argument('--min-tweets', type=int, default=3, help='博主报告的最小推文数')
+    parser.add_argument('--pretty', action='store_true', help='输出带缩进的 JSON 文件（便于查看和 diff）')
 
     args = parser.parse_args()
+    BaseModule.pretty_json = args.pretty
     pipeline = Pipeline()
 
     if args.author_report:
@@ -4,6 +4,7 @@ AI 推文抓取系统 - 入口脚本 (v2)
 """
 
 import argparse
+from modules import BaseModule
 from pipeline import Pipeline
 
 
@@ -37,8 +38,14 @@ def main():
         action='store_true',
         help='启用事件输出（用于可视化前端）'
     )
+    parser.add_argument(
+        '--pretty',
+        action='store_true',
+        help='输出带缩进的 JSON 文件（便于查看和 diff）'
+    )
 
     args = parser.parse_args()
+    BaseModule.pretty_json = args.pretty
 
     # 创建 Pipeline，传入 emit_events 参数
     pipeline = Pipeline(emit_events=args.emit_events)